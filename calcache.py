@@ -0,0 +1,486 @@
+"""
+Content addressed cache for telescope calibrations.
+
+A calibration is identified by a key computed from the contents of the rawfile,
+the gear file, the serialized calibration paths and all other existing input
+files the processor parameters refer to (e.g. the gain calibration DB). After a calibration, the
+localDB/caltag folder (NoiseDB, alignmentDB, clusterDB files) is stored under
+cal-cache/key/. When a calibration with the same key is requested again, the
+stored folder is copied to localDB/caltag instead of running the calibration.
+
+Long calibrations can also be checkpointed step by step. Every calibration path
+gets a key chained from the key of the previous step, its own serialized path and
+the contents of its input files. The files a step writes into the tmp-runs folder
+are stored under cal-checkpoints/key/. Only steps whose Marlin job terminated
+normally and whose output files are not empty are checkpointed. A rerun restores
+all steps with existing checkpoints and resumes with the first step whose key has
+no checkpoint.
+
+The clusters written by the clusterizer step (tmp.slcio) can be kept in
+cluster-store/caltag/ for the reconstruction, together with the cached center of
+gravity hits (tmp-hits.slcio) if present. The manifest records the rawfile, the
+clusterizer configuration (unpackers, gain calibration and clusterizers) and the
+hashes of the NoiseDB files used for clustering, so that the stored clusters are
+only used with the same configuration and while the masks in localDB/caltag are
+unchanged. Hits are only used
+with an unchanged hit maker configuration.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import profiling
+
+# Default folder holding cached calibrations
+cachedir = 'cal-cache'
+
+# Default folder holding checkpoints of calibration steps
+checkpointdir = 'cal-checkpoints'
+
+# Default folder holding the clusterizer output of calibrations
+clusterdir = 'cluster-store'
+
+# Attributes of path objects that depend on the workspace rather than on the calibration
+_ignored_attributes = ('tmpdir',)
+
+# Processor parameters naming files written by the processor
+_output_parameters = ('LCIOOutputFile', 'RootFileName', 'OutputRootFileName')
+
+
+def hash_file(filename, digest=None, blocksize=1 << 20):
+  """
+  Updates digest with the contents of filename and returns it
+  """
+
+  if digest is None:
+    digest = hashlib.sha1()
+  with open(filename, 'rb') as f:
+    for block in iter(lambda: f.read(blocksize), b''):
+      digest.update(block)
+  return digest
+
+
+def serialize(obj, _seen=None):
+  """
+  Returns a json compatible representation of a tbsw path, processor or
+  list of paths. Objects are represented by their attributes.
+  """
+
+  if _seen is None:
+    _seen = set()
+
+  if isinstance(obj, (str, int, float, bool)) or obj is None:
+    return obj
+  if isinstance(obj, dict):
+    return dict( (str(k), serialize(v, _seen)) for k, v in obj.items() )
+  if isinstance(obj, (list, tuple)):
+    return [ serialize(v, _seen) for v in obj ]
+  if hasattr(obj, '__dict__'):
+    if id(obj) in _seen:
+      return '<{}>'.format(type(obj).__name__)
+    _seen = _seen | set([id(obj)])
+    attributes = dict( (k, v) for k, v in vars(obj).items() if k not in _ignored_attributes )
+    return { type(obj).__name__: serialize(attributes, _seen) }
+  return str(obj)
+
+
+def serialize_paths(rawfile, paths):
+  """
+  Returns a json string describing the list of paths
+  """
+
+  # The location of the rawfile does not change the calibration
+  return json.dumps(serialize(paths), sort_keys=True).replace(rawfile, 'RAWFILE')
+
+
+def _find_files(obj, found):
+  """
+  Adds all existing files named in a serialized path to found, skipping the
+  files named by output parameters
+  """
+
+  if isinstance(obj, dict):
+    for k, v in obj.items():
+      if k not in _output_parameters:
+        _find_files(v, found)
+  elif isinstance(obj, list):
+    for v in obj:
+      _find_files(v, found)
+  elif isinstance(obj, str):
+    for token in obj.split():
+      if os.path.isfile(token):
+        found.add(token)
+
+
+def _find_outputs(obj, found):
+  """
+  Adds all files named by output parameters in a serialized path to found
+  """
+
+  if isinstance(obj, dict):
+    for k, v in obj.items():
+      if k in _output_parameters and isinstance(v, str):
+        found.update(v.split())
+      else:
+        _find_outputs(v, found)
+  elif isinstance(obj, list):
+    for v in obj:
+      _find_outputs(v, found)
+
+
+def get_inputs(rawfile, gearfile, paths):
+  """
+  Returns the sorted list of existing input files the parameters of the paths
+  refer to, besides rawfile and gearfile. Files in localDB are written and read
+  by the calibration itself and are not inputs.
+  """
+
+  found = set()
+  _find_files(serialize(paths), found)
+  ignored = set([ os.path.abspath(rawfile), os.path.abspath(gearfile) ])
+  return sorted( filename for filename in found if os.path.abspath(filename) not in ignored and
+                 not os.path.normpath(filename).startswith('localDB' + os.sep) )
+
+
+def hash_inputs(rawfile, gearfile, paths, digest):
+  """
+  Updates digest with the contents of the input files of the paths
+  """
+
+  for filename in get_inputs(rawfile, gearfile, paths):
+    digest.update(filename.encode('utf8'))
+    hash_file(filename, digest)
+  return digest
+
+
+def get_key(rawfile, gearfile, paths, extra=''):
+  """
+  Returns the cache key for calibrating rawfile with gearfile using the list of paths.
+  The string extra describes calibration steps done outside of the paths.
+  """
+
+  digest = hashlib.sha1()
+  hash_file(rawfile, digest)
+  hash_file(gearfile, digest)
+  digest.update(extra.encode('utf8'))
+  digest.update(serialize_paths(rawfile, paths).encode('utf8'))
+  hash_inputs(rawfile, gearfile, paths, digest)
+
+  return digest.hexdigest()
+
+
+def get_step_keys(rawfile, gearfile, paths, extra=''):
+  """
+  Returns a list of checkpoint keys, one for every calibration path. The key of
+  a step depends on the keys of all previous steps. The string extra describes
+  calibration steps done outside of the paths.
+  """
+
+  digest = hashlib.sha1()
+  hash_file(rawfile, digest)
+  hash_file(gearfile, digest)
+  digest.update(extra.encode('utf8'))
+  key = digest.hexdigest()
+
+  keys = []
+  for path in paths:
+    digest = hashlib.sha1(key.encode('utf8'))
+    digest.update(serialize_paths(rawfile, [path]).encode('utf8'))
+    hash_inputs(rawfile, gearfile, [path], digest)
+    key = digest.hexdigest()
+    keys.append(key)
+  return keys
+
+
+def restore(key, caltag, cachedir=cachedir):
+  """
+  Copies a cached calibration to localDB/caltag. Returns False if the key is not in the cache.
+  """
+
+  source = os.path.join(cachedir, key)
+  if not os.path.isdir(source):
+    return False
+
+  target = os.path.join('localDB', caltag)
+  if os.path.isdir(target):
+    shutil.rmtree(target)
+  shutil.copytree(source, target)
+  return True
+
+
+def store(key, caltag, cachedir=cachedir):
+  """
+  Copies the calibration in localDB/caltag into the cache
+  """
+
+  target = os.path.join(cachedir, key)
+  if os.path.isdir(target):
+    return
+
+  # Copy to a temporary folder first, so that concurrent runs never
+  # see a partially written cache entry
+  tmptarget = target + '.tmp{:d}'.format(os.getpid())
+  shutil.copytree(os.path.join('localDB', caltag), tmptarget)
+  try:
+    os.rename(tmptarget, target)
+  except OSError:
+    # Another process stored the same key first
+    shutil.rmtree(tmptarget)
+
+
+def _list_files(folder):
+  """
+  Returns a dictionary mapping relative file names in folder to (size, mtime)
+  """
+
+  files = {}
+  for dirpath, dirnames, filenames in os.walk(folder):
+    for filename in filenames:
+      fullname = os.path.join(dirpath, filename)
+      stat = os.stat(fullname)
+      files[os.path.relpath(fullname, folder)] = (stat.st_size, stat.st_mtime_ns)
+  return files
+
+
+def _copy_file(source, target):
+  """
+  Copies source to target. LCIO files are hard linked when possible, since they
+  are only written by the clusterizer step and never modified in place.
+  """
+
+  targetdir = os.path.dirname(target)
+  if targetdir and not os.path.isdir(targetdir):
+    os.makedirs(targetdir)
+  if os.path.exists(target):
+    os.remove(target)
+
+  if source.endswith('.slcio'):
+    try:
+      os.link(source, target)
+      return
+    except OSError:
+      pass
+  shutil.copy2(source, target)
+
+
+def save_checkpoint(key, tmpdir, files, checkpointdir=checkpointdir):
+  """
+  Stores the listed files from tmpdir as checkpoint key
+  """
+
+  target = os.path.join(checkpointdir, key)
+  if os.path.isdir(target):
+    return
+
+  tmptarget = target + '.tmp{:d}'.format(os.getpid())
+  os.makedirs(tmptarget)
+  for filename in files:
+    _copy_file(os.path.join(tmpdir, filename), os.path.join(tmptarget, 'files', filename))
+  with open(os.path.join(tmptarget, 'manifest.json'), 'w') as f:
+    json.dump({'key': key, 'files': sorted(files)}, f, indent=2)
+
+  try:
+    os.rename(tmptarget, target)
+  except OSError:
+    # Another process stored the same checkpoint first
+    shutil.rmtree(tmptarget)
+
+
+def restore_checkpoint(key, tmpdir, checkpointdir=checkpointdir):
+  """
+  Copies the files of checkpoint key into tmpdir
+  """
+
+  source = os.path.join(checkpointdir, key)
+  with open(os.path.join(source, 'manifest.json'), 'r') as f:
+    manifest = json.load(f)
+  for filename in manifest['files']:
+    _copy_file(os.path.join(source, 'files', filename), os.path.join(tmpdir, filename))
+
+
+def check_step(tmpdir, path, changed):
+  """
+  Returns a message describing why a calibration step failed, or None if Marlin
+  terminated normally and the files written by the step are not empty. The
+  list changed holds the files in tmpdir written by the step.
+  """
+
+  # Marlin only prints the timing summary when it terminates normally
+  logs = [ filename for filename in changed if filename.endswith('.log') ]
+  if not any( profiling.parse_timing(os.path.join(tmpdir, filename)) for filename in logs ):
+    return "Marlin did not terminate normally"
+
+  # LCIO outputs must exist, all written files must have contents
+  outputs = set()
+  _find_outputs(serialize([path]), outputs)
+  expected = set( filename for filename in outputs if filename.endswith('.slcio') )
+  for filename in sorted(expected | set(changed)):
+    fullname = os.path.join(tmpdir, filename)
+    if not os.path.isfile(fullname) or os.path.getsize(fullname) == 0:
+      return "Output file {} is missing or empty".format(filename)
+  return None
+
+
+def run_step(CalObj, path, rawfile, caltag, tmpdir):
+  """
+  Runs a single calibration path and returns the list of files in tmpdir written
+  by it. tbsw does not report failed Marlin jobs, a broken step raises a RuntimeError
+  so that it is neither cached nor continued.
+  """
+
+  before = _list_files(tmpdir)
+  CalObj.calibrate(paths=[path], ifile=rawfile, caltag=caltag)
+  after = _list_files(tmpdir)
+
+  changed = [ filename for filename, stat in after.items() if before.get(filename) != stat ]
+  error = check_step(tmpdir, path, changed)
+  if error is not None:
+    raise RuntimeError("Calibration step {} failed: {}".format(path.name, error))
+  return changed
+
+
+def calibrate_steps(CalObj, paths, rawfile, gearfile, caltag, tmpdir, checkpointdir=checkpointdir, extra='', export=True):
+  """
+  Runs the calibration paths one by one and checkpoints every step. Steps with
+  an existing checkpoint are restored instead of processed. With export=False,
+  only the checkpoints are kept and no localDB/caltag folder is left behind.
+  Returns the list of checkpoint keys.
+  """
+
+  keys = get_step_keys(rawfile, gearfile, paths, extra=extra)
+
+  # Find the first step without valid checkpoint
+  first = 0
+  while first < len(paths) and os.path.isdir(os.path.join(checkpointdir, keys[first])):
+    first += 1
+
+  for key in keys[:first]:
+    restore_checkpoint(key, tmpdir, checkpointdir=checkpointdir)
+
+  if first == len(paths):
+    print("Restored all {:d} calibration steps from checkpoints".format(len(paths)))
+    if export:
+      CalObj.export_caltag(caltag)
+    return keys
+
+  print("Restored {:d} calibration steps from checkpoints, resume with step {:d}".format(first, first))
+
+  for key, path in zip(keys[first:], paths[first:]):
+    # Checkpoint all files written by this step
+    changed = run_step(CalObj, path, rawfile, caltag, tmpdir)
+    save_checkpoint(key, tmpdir, changed, checkpointdir=checkpointdir)
+
+  # tbsw exports the caltag after every path
+  if not export and os.path.isdir(os.path.join('localDB', caltag)):
+    shutil.rmtree(os.path.join('localDB', caltag))
+
+  return keys
+
+
+def remove_checkpoints(keys, checkpointdir=checkpointdir):
+  """
+  Removes the checkpoints of the listed keys
+  """
+
+  for key in set(keys):
+    target = os.path.join(checkpointdir, key)
+    if os.path.isdir(target):
+      shutil.rmtree(target)
+
+
+def _hash_noisedbs(folder, noisedbs):
+  """
+  Returns a dictionary mapping the NoiseDB file names to the hashes of their contents in folder
+  """
+
+  hashes = {}
+  for filename in noisedbs:
+    fullname = os.path.join(folder, filename)
+    if os.path.isfile(fullname):
+      hashes[filename] = hash_file(fullname).hexdigest()
+  return hashes
+
+
+def _describe_rawfile(rawfile):
+  """
+  Returns a dictionary identifying the rawfile without reading it
+  """
+
+  stat = os.stat(rawfile)
+  return {'name': os.path.abspath(rawfile), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def store_clusters(tmpdir, rawfile, caltag, noisedbs, clusterconfig='', hitconfig='', clusterdir=clusterdir):
+  """
+  Stores the clusterizer output tmp.slcio and the hit cache tmp-hits.slcio of a
+  calibration in tmpdir for the reconstruction with caltag. The strings clusterconfig
+  and hitconfig describe the clusterizers and the hit makers of the hit cache.
+  Returns False if tmpdir holds no clusters.
+  """
+
+  source = os.path.join(tmpdir, 'tmp.slcio')
+  if not os.path.isfile(source):
+    return False
+
+  target = os.path.join(clusterdir, caltag)
+  if os.path.isdir(target):
+    shutil.rmtree(target)
+  os.makedirs(target)
+
+  _copy_file(source, os.path.join(target, 'clusters.slcio'))
+  manifest = {'rawfile': _describe_rawfile(rawfile), 'clusters': clusterconfig, 'noisedbs': _hash_noisedbs(os.path.join(tmpdir, 'localDB'), noisedbs)}
+
+  if os.path.isfile(os.path.join(tmpdir, 'tmp-hits.slcio')):
+    _copy_file(os.path.join(tmpdir, 'tmp-hits.slcio'), os.path.join(target, 'hits.slcio'))
+    manifest['hits'] = hitconfig
+  with open(os.path.join(target, 'manifest.json'), 'w') as f:
+    json.dump(manifest, f, indent=2)
+  return True
+
+
+def _read_manifest(rawfile, caltag, noisedbs, clusterconfig, clusterdir):
+  """
+  Returns the manifest of the cluster store for caltag. Returns None if it is
+  missing or does not match the rawfile, the clusterizer configuration and the
+  NoiseDB files in localDB/caltag.
+  """
+
+  source = os.path.join(clusterdir, caltag)
+  if not os.path.isfile(os.path.join(source, 'manifest.json')):
+    return None
+
+  with open(os.path.join(source, 'manifest.json'), 'r') as f:
+    manifest = json.load(f)
+  if manifest['rawfile'] != _describe_rawfile(rawfile):
+    return None
+  if manifest.get('clusters') != clusterconfig:
+    return None
+  if manifest['noisedbs'] != _hash_noisedbs(os.path.join('localDB', caltag), noisedbs):
+    return None
+  return manifest
+
+
+def find_clusters(rawfile, caltag, noisedbs, clusterconfig, clusterdir=clusterdir):
+  """
+  Returns the absolute name of the stored clusters of rawfile for caltag. Returns
+  None if no clusters are stored, the clusters were made with a different clusterizer
+  configuration or the NoiseDB files in localDB/caltag changed since clustering.
+  """
+
+  if _read_manifest(rawfile, caltag, noisedbs, clusterconfig, clusterdir) is None:
+    return None
+  return os.path.abspath(os.path.join(clusterdir, caltag, 'clusters.slcio'))
+
+
+def find_hits(rawfile, caltag, noisedbs, clusterconfig, hitconfig, clusterdir=clusterdir):
+  """
+  Returns the absolute name of the stored center of gravity hits of rawfile for
+  caltag. Returns None if no hits are stored, the clusterizer configuration or the
+  NoiseDB files changed or the hits were made with a different hit maker configuration.
+  """
+
+  manifest = _read_manifest(rawfile, caltag, noisedbs, clusterconfig, clusterdir)
+  if manifest is None or manifest.get('hits') != hitconfig:
+    return None
+  return os.path.abspath(os.path.join(clusterdir, caltag, 'hits.slcio'))
@@ -0,0 +1,143 @@
+"""
+Adaptive iteration of calibration paths.
+
+The calibration path lists repeat some paths a fixed number of times, e.g. the
+aligner path three times and the clustercal path six times. This module runs
+such repeated paths as an iteration group: after every iteration, the files in
+the localDB folder of the calibration are compared with their state before the
+iteration. The group stops as soon as all changed alignment and cluster DB files
+are stable within tolerance, and continues past the default number of iterations
+(up to maxIterationFactor times the default) while they are not.
+
+alignmentDB files converge when no bin of their histograms changes by more than
+alignTolerance (mm for shifts, rad for rotations). clusterDB files converge when
+no bin changes by more than clusterDBTolerance relative to its previous value.
+Other files, e.g. the NoiseDB files, are not checked. Every path is run with
+calcache.run_step, which raises if the Marlin job did not finish.
+"""
+
+import os
+import calcache
+from ROOT import TFile
+
+
+def get_groups(paths):
+  """
+  Returns a list of (path, count) tuples merging consecutive repetitions of
+  the same path object
+  """
+
+  groups = []
+  for path in paths:
+    if groups and groups[-1][0] is path:
+      groups[-1] = (path, groups[-1][1] + 1)
+    else:
+      groups.append( (path, 1) )
+  return groups
+
+
+def read_histograms(filename):
+  """
+  Returns a dictionary mapping histogram names in a root file to lists of bin contents
+  """
+
+  histos = {}
+  rootfile = TFile(filename, "READ")
+  for key in rootfile.GetListOfKeys():
+    obj = key.ReadObj()
+    if obj.InheritsFrom("TH1"):
+      histos[key.GetName()] = [ obj.GetBinContent(i) for i in range(obj.GetNcells()) ]
+  rootfile.Close()
+  return histos
+
+
+def get_change(before, after, relative=False):
+  """
+  Returns the largest change of a bin content between two dictionaries of histograms
+  """
+
+  change = 0.0
+  for name, contents in after.items():
+    if name not in before or len(before[name]) != len(contents):
+      return float('inf')
+    for old, new in zip(before[name], contents):
+      delta = abs(new - old)
+      if relative and old != 0:
+        delta /= abs(old)
+      change = max(change, delta)
+  return change
+
+
+def get_tolerance(filename, setup):
+  """
+  Returns (tolerance, relative) for a DB file, or None if the file is not checked
+  """
+
+  basename = os.path.basename(filename)
+  if basename.startswith('alignmentDB'):
+    return setup['alignTolerance'], False
+  if basename.startswith('clusterDB'):
+    return setup['clusterDBTolerance'], True
+  return None
+
+
+def snapshot(dbdir, setup):
+  """
+  Returns a dictionary mapping all checked DB files in dbdir to their histograms and mtime
+  """
+
+  state = {}
+  if not os.path.isdir(dbdir):
+    return state
+  for filename in sorted(os.listdir(dbdir)):
+    fullname = os.path.join(dbdir, filename)
+    if filename.endswith('.root') and get_tolerance(filename, setup) is not None:
+      state[filename] = (os.stat(fullname).st_mtime_ns, read_histograms(fullname))
+  return state
+
+
+def is_converged(before, after, setup):
+  """
+  Returns True if all DB files changed between two snapshots are stable within tolerance.
+  Every iterated path writes an alignment or cluster DB, so a RuntimeError is
+  raised if no DB file was rewritten: the Marlin job failed silently.
+  """
+
+  if all( filename in before and before[filename][0] == mtime for filename, (mtime, histos) in after.items() ):
+    raise RuntimeError("No alignmentDB or clusterDB file was rewritten by the iteration")
+
+  for filename, (mtime, histos) in after.items():
+    if filename in before and before[filename][0] == mtime:
+      continue
+    if filename not in before:
+      return False
+    tolerance, relative = get_tolerance(filename, setup)
+    change = get_change(before[filename][1], histos, relative=relative)
+    print("Change of {}: {:g} (tolerance {:g})".format(filename, change, tolerance))
+    if change > tolerance:
+      return False
+  return True
+
+
+def calibrate_adaptive(CalObj, paths, rawfile, caltag, tmpdir, setup):
+  """
+  Runs the calibration paths one by one. Repeated paths are iterated until the
+  alignment and cluster DB files converge.
+  """
+
+  dbdir = os.path.join(tmpdir, 'localDB')
+
+  for path, count in get_groups(paths):
+    if count == 1:
+      calcache.run_step(CalObj, path, rawfile, caltag, tmpdir)
+      continue
+
+    maxIterations = int(count * setup['maxIterationFactor'])
+    for iteration in range(maxIterations):
+      before = snapshot(dbdir, setup)
+      calcache.run_step(CalObj, path, rawfile, caltag, tmpdir)
+      if is_converged(before, snapshot(dbdir, setup), setup):
+        print("Path {} converged after {:d} iterations (default {:d})".format(path.name, iteration + 1, count))
+        break
+    else:
+      print("Path {} did not converge in {:d} iterations".format(path.name, maxIterations))
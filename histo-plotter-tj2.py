@@ -7,6 +7,20 @@ plotter assumes pixel matrix with rectangular pixels.
 
 python histo-plotter-tj2.py --colstart 320  --colstop 420 --runno=826
 
+Every plot function scans the Hit or Track tree again. To keep the repeated scans
+cheap, the baskets of both trees are loaded into memory once, and all plots of the
+ROI only read the Track tree entries inside the ROI (selected in one pass into an
+entry list). With --iEvt, the event cut is turned into a range of entries using the
+run summary written by the reconstruction (see runsummary.py). The cut strings of
+the plots are unchanged.
+
+In batch mode, a list of runs and ROIs is plotted by a pool of worker processes.
+ROOT and the tbsw plotting modules are loaded once before the workers are started,
+so every plot job only opens its input file. Every run and ROI gets its own
+Plotter root and pdf file.
+
+python histo-plotter-tj2.py --runlist 826,830-835 --rois 110,200,1,400 320,420,1,400 --ncores 8
+
 Author: Benjamin Schwenker <benjamin.schwenker@phys.uni-goettingen.de>  
 """
 
@@ -16,7 +30,12 @@ import tbsw.efficiency as efficiency
 import tbsw.inpixel as inpixel
 import ROOT
 import os
+import sys
 import glob
+import runsummary
+import multiprocessing
+import traceback
+from runlist import parse_runlist
 
 import argparse
 parser = argparse.ArgumentParser(description="Perform plotting of test beam runs")
@@ -30,7 +49,30 @@ parser.add_argument('--iEvt', default=-1, type=int, help='Decides range and labe
 parser.add_argument('--CoG', action='store_true', help='Use CoG in filenames')
 parser.add_argument('--prefix', default='', type=str, help='add prefix to used filename')
 
+parser.add_argument('--maxmemory', default=2000, type=int, help='Maximum memory in MB for loading the baskets of the Hit and Track trees. In batch mode, the memory is shared by all workers.')
+parser.add_argument('--runlist', default='', type=str, help='List of runs to plot in batch mode, e.g. 826,830-835')
+parser.add_argument('--rois', default=[], nargs='+', type=str, help='List of ROIs to plot in batch mode, every ROI given as colstart,colstop,rowstart,rowstop')
+parser.add_argument('--ncores', default=multiprocessing.cpu_count(), type=int, help='Number of plot jobs processed in parallel in batch mode')
+
 args = parser.parse_args()
+
+
+def preload_tree(inputfile, name, maxmemory):
+  """
+  Loads all baskets of a tree into memory, so that repeated scans do not read the file again
+  """
+  tree = inputfile.Get(name)
+  tree.LoadBaskets(maxmemory*1024*1024)
+  return tree
+
+def select_entries(inputfile, tree, cut, name):
+  """
+  Restricts all following scans of tree to the entries passing cut
+  """
+  # Keep the entry list in the input file, it must not be written into the histofile
+  with ROOT.TDirectory.TContext(inputfile):
+    tree.Draw(">>" + name, cut, "entrylist")
+    tree.SetEntryList(inputfile.Get(name))
   
 print(args.prefix)
 # Every plotting axis is given as a tuple (nbins,min,max) 
@@ -60,85 +102,189 @@ elif args.calib == 'electrons':
               'sensor_u_axis':     (512,-0.5*512*0.03304,0.5*512*0.03304),
               'sensor_v_axis':     (512,-0.5*512*0.03304,0.5*512*0.03304), 
             }
-        
-if args.calib == 'ToT':
-  inputfilename="root-files/Histos-TJ2-run{}{}-run{}{}--reco.root".format(args.runno,args.prefix,args.runno, args.prefix)
-  print(inputfilename)
-  histofilename=f"Plotter/Plotter-run{args.runno:06d}_{args.prefix}-roi-{args.colstart}-{args.colstop}-{args.rowstart}-{args.rowstop}_{args.iEvt}.root"
-  pdffilename=f"Plotter/Plotter-run{args.runno:06d}_{args.prefix}-roi-{args.colstart}-{args.colstop}-{args.rowstart}-{args.rowstop}_{args.iEvt}.pdf"
-elif args.calib == 'electrons':
-  inputfilename="root-files/Histos-TJ2-run{:06d}_{}-run{:06d}-run{:06d}_{}-reco.root".format(args.runno,args.prefix,args.runno,args.runno, args.prefix)
-  print(inputfilename)
-  histofilename=f"Plotter_cal/Plotter-run{args.runno:06d}_{args.prefix}_cal-roi-{args.colstart}-{args.colstop}-{args.rowstart}-{args.rowstop}.root"
-  pdffilename=f"Plotter_cal/Plotter-run{args.runno:06d}_{args.prefix}_cal-roi-{args.colstart}-{args.colstop}-{args.rowstart}-{args.rowstop}.pdf"
-print(pdffilename)
-
-
-# Open files with reconstructed run data 
-inputfile = ROOT.TFile(inputfilename, 'READ' )   
-
-# Access the TTree containing the event information
-tree = inputfile.Get("Hit") 
-
-# Get the maximum value in the iEvt branch
-max_iEvt = tree.GetMaximum("iEvt")
-# Define the maximum iEvt value for the base cut
-max_iEvt_cut = (max_iEvt/100)*args.iEvt
-
-print("The highest number in iEvt is:", max_iEvt)
-
-
-if args.iEvt > 0:
-  # Create one histofile per run  
-  histofile = ROOT.TFile( histofilename, 'RECREATE', 'Histos created from file ' + inputfilename )
-
-  # Add residual plots 
-  residuals.plot(inputfile, histofile, basecut="hasTrack==0 && iEvt >= {}".format(max_iEvt_cut), Config=DUTConfig)
-      
-  # Add efficiency plots   
-  efficiency.plot(inputfile, histofile, basecut="maskedPixel==0 && iEvt >= {}".format(max_iEvt_cut), matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
-      
-  # Add superpixel in-pixel charge plots 
-  inpixel.plot_superpixel(inputfile, histofile, pixeltype=0, upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20, ufold=2, vfold=2)             
-        
-  # Add superpixel in-pixel efficiency plots with event cut
-  efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(args.colstart, args.colstop,args.rowstart,args.rowstop,max_iEvt_cut), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
-
-  # Compute efficiency (and error) in specified ROI
-  efficiency.extract_roi(inputfile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(args.colstart, args.colstop,args.rowstart,args.rowstop,max_iEvt_cut), matchcut="hasHit==0", uaxis=(args.colstop-args.colstart-1,args.colstart,args.colstop), vaxis=(128,args.rowstart,args.rowstop))
-
-  # Make a pdf containing all plots 
-  residuals.make_pdf(histofile, pdffilename)
-
-else:  
-  # Create one histofile per run  
-  histofile = ROOT.TFile( histofilename, 'RECREATE', 'Histos created from file ' + inputfilename )
-
-  # Add residual plots 
-  residuals.plot(inputfile, histofile, basecut="hasTrack==0 ", Config=DUTConfig)
-  # Add residual plots
-  residuals.plot_roi(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(args.colstart, args.colstop,args.rowstart,args.rowstop), Config=DUTConfig)    
-  # Add efficiency plots   
-  efficiency.plot(inputfile, histofile, basecut="maskedPixel==0", matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
-  efficiency.plot(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(args.colstart, args.colstop,args.rowstart,args.rowstop), matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
-     
-  # Add superpixel in-pixel charge plots 
-  inpixel.plot_superpixel(inputfile, histofile, pixeltype=0, upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20, ufold=2, vfold=2)             
-        
-  # Add superpixel in-pixel efficiency plots
-  efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(args.colstart, args.colstop,args.rowstart,args.rowstop), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
-
-  # Add superpixel in-pixel efficiency plots with event cut
-  #efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(args.colstart, args.colstop,args.rowstart,args.rowstop,max_iEvt_cut), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
-
-  # Compute efficiency (and error) in specified ROI
-  efficiency.extract_roi(inputfile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(args.colstart, args.colstop,args.rowstart,args.rowstop), matchcut="hasHit==0", uaxis=(args.colstop-args.colstart-1,args.colstart,args.colstop), vaxis=(128,args.rowstart,args.rowstop))
-
-
-  # Make a pdf containing all plots 
-  residuals.make_pdf(histofile, pdffilename)
-
-# Close all files 
-histofile.Write()
-histofile.Close()
-inputfile.Close()
+
+
+def parse_roi(roi):
+  """
+  Returns a tuple (colstart, colstop, rowstart, rowstop) from a string like '110,200,1,400'
+  """
+  values = [ int(value) for value in roi.split(',') ]
+  if len(values) != 4:
+    parser.error('ROI must be given as colstart,colstop,rowstart,rowstop')
+  return tuple(values)
+
+def plot_run(params):
+  """
+  Creates the Plotter root and pdf files for a run and ROI
+  """
+  
+  runno, colstart, colstop, rowstart, rowstop = params
+  
+  if args.calib == 'ToT':
+    inputfilename="root-files/Histos-TJ2-run{}{}-run{}{}--reco.root".format(runno,args.prefix,runno, args.prefix)
+    print(inputfilename)
+    histofilename=f"Plotter/Plotter-run{runno:06d}_{args.prefix}-roi-{colstart}-{colstop}-{rowstart}-{rowstop}_{args.iEvt}.root"
+    pdffilename=f"Plotter/Plotter-run{runno:06d}_{args.prefix}-roi-{colstart}-{colstop}-{rowstart}-{rowstop}_{args.iEvt}.pdf"
+  elif args.calib == 'electrons':
+    inputfilename="root-files/Histos-TJ2-run{:06d}_{}-run{:06d}-run{:06d}_{}-reco.root".format(runno,args.prefix,runno,runno, args.prefix)
+    print(inputfilename)
+    histofilename=f"Plotter_cal/Plotter-run{runno:06d}_{args.prefix}_cal-roi-{colstart}-{colstop}-{rowstart}-{rowstop}.root"
+    pdffilename=f"Plotter_cal/Plotter-run{runno:06d}_{args.prefix}_cal-roi-{colstart}-{colstop}-{rowstart}-{rowstop}.pdf"
+  print(pdffilename)
+
+
+  # Open files with reconstructed run data 
+  inputfile = ROOT.TFile(inputfilename, 'READ' )   
+
+  # Access the TTree containing the event information
+  tree = preload_tree(inputfile, "Hit", args.maxmemory)
+  tracktree = preload_tree(inputfile, "Track", args.maxmemory)
+
+  # Get the maximum value in the iEvt branch of the Hit tree from the run summary
+  # written by the reconstruction, older files and empty trees need a scan of the branch
+  summary = runsummary.read(inputfile)
+  if summary is None or summary.get('lastHitEvent', -1) < 0:
+    max_iEvt = tree.GetMaximum("iEvt")
+  else:
+    max_iEvt = summary['lastHitEvent']
+  # Define the maximum iEvt value for the base cut
+  max_iEvt_cut = (max_iEvt/100)*args.iEvt
+
+  print("The highest number in iEvt is:", max_iEvt)
+
+  if args.iEvt > 0:
+    # Both trees are filled in event order, the event cut is a range of entries
+    for eventtree, name in [ (tree, "hitrange"), (tracktree, "trackrange") ]:
+      firstentry = runsummary.find_first_entry(eventtree, max_iEvt_cut)
+      with ROOT.TDirectory.TContext(inputfile):
+        eventtree.Draw(">>" + name, "", "entrylist", eventtree.GetEntries() - firstentry, firstentry)
+        eventtree.SetEntryList(inputfile.Get(name))
+
+
+  if args.iEvt > 0:
+    # Create one histofile per run  
+    histofile = ROOT.TFile( histofilename, 'RECREATE', 'Histos created from file ' + inputfilename )
+
+    # Add residual plots 
+    residuals.plot(inputfile, histofile, basecut="hasTrack==0 && iEvt >= {}".format(max_iEvt_cut), Config=DUTConfig)
+
+    # Add efficiency plots   
+    efficiency.plot(inputfile, histofile, basecut="maskedPixel==0 && iEvt >= {}".format(max_iEvt_cut), matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
+
+    # Add superpixel in-pixel charge plots, they have no event cut and
+    # need all entries of both trees
+    tree.SetEntryList(ROOT.nullptr)
+    tracktree.SetEntryList(ROOT.nullptr)
+    inpixel.plot_superpixel(inputfile, histofile, pixeltype=0, upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20, ufold=2, vfold=2)
+
+    # All following plots of the Track tree have the event cut and are inside
+    # the ROI, select the ROI from the entries in the event range
+    tracktree.SetEntryList(inputfile.Get("trackrange"))
+    select_entries(inputfile, tracktree, "cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), "roi")
+
+    # Add superpixel in-pixel efficiency plots with event cut
+    efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(colstart, colstop,rowstart,rowstop,max_iEvt_cut), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
+
+    # Compute efficiency (and error) in specified ROI
+    efficiency.extract_roi(inputfile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(colstart, colstop,rowstart,rowstop,max_iEvt_cut), matchcut="hasHit==0", uaxis=(colstop-colstart-1,colstart,colstop), vaxis=(128,rowstart,rowstop))
+
+    # Make a pdf containing all plots 
+    residuals.make_pdf(histofile, pdffilename)
+
+  else:  
+    # Create one histofile per run  
+    histofile = ROOT.TFile( histofilename, 'RECREATE', 'Histos created from file ' + inputfilename )
+
+    # Add residual plots 
+    residuals.plot(inputfile, histofile, basecut="hasTrack==0 ", Config=DUTConfig)
+    # Add residual plots
+    residuals.plot_roi(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), Config=DUTConfig)    
+    # Add efficiency plots   
+    efficiency.plot(inputfile, histofile, basecut="maskedPixel==0", matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
+
+    efficiency.plot(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), matchcut="hasHit==0", uaxis=(512,0,512), vaxis=(512,0,512))
+
+    # Add superpixel in-pixel charge plots 
+    inpixel.plot_superpixel(inputfile, histofile, pixeltype=0, upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20, ufold=2, vfold=2)             
+
+    # All following plots of the Track tree are inside the ROI
+    select_entries(inputfile, tracktree, "cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), "roi")
+
+    # Add superpixel in-pixel efficiency plots
+    efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
+
+    # Add superpixel in-pixel efficiency plots with event cut
+    #efficiency.plot_super_inpix(inputfile, histofile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{} && iEvt >= {}".format(colstart, colstop,rowstart,rowstop,max_iEvt_cut), matchcut="hasHit==0", upitch=DUTConfig['pitch_u'], vpitch=DUTConfig['pitch_v'], ubins=20, vbins=20)
+
+    # Compute efficiency (and error) in specified ROI
+    efficiency.extract_roi(inputfile, basecut="maskedPixel==0 && cellU_fit>{} && cellU_fit<{} && cellV_fit> {} && cellV_fit<{}".format(colstart, colstop,rowstart,rowstop), matchcut="hasHit==0", uaxis=(colstop-colstart-1,colstart,colstop), vaxis=(128,rowstart,rowstop))
+
+
+    # Make a pdf containing all plots 
+    residuals.make_pdf(histofile, pdffilename)
+
+  # Close all files 
+  histofile.Write()
+  histofile.Close()
+  inputfile.Close()
+
+def plot_batch(params):
+  """
+  Multiprocessing work for batch mode. Failures are reported and do not 
+  stop the plotting of other runs. 
+  """
+  try:
+    plot_run(params)
+    return True
+  except Exception:
+    traceback.print_exc()
+    return False
+
+def init_worker():
+  """
+  Initializes a batch worker, ROOT is already loaded by the parent process
+  """
+  ROOT.gROOT.SetBatch(True)
+
+
+roi = (args.colstart, args.colstop, args.rowstart, args.rowstop)
+
+if args.runlist == '' and args.runno is None:
+  parser.error('--runno or --runlist is required')
+
+if args.runlist == '' and not args.rois:
+  plot_run( (args.runno,) + roi )
+else:
+  if args.runlist == '':
+    runs = [ args.runno ]
+  else:
+    runs = parse_runlist(args.runlist)
+  
+  if args.rois:
+    rois = [ parse_roi(item) for item in args.rois ]
+  else:
+    rois = [ roi ]
+  
+  params_list = [ (run,) + item for run in runs for item in rois ]
+  
+  # Finish the startup of ROOT before forking, the workers inherit the
+  # loaded libraries and the interpreter 
+  ROOT.gROOT.SetBatch(True)
+  
+  count = min(args.ncores, len(params_list))
+  
+  # Every worker preloads its trees, share the memory budget among them
+  args.maxmemory = max(1, args.maxmemory // count)
+  
+  pool = multiprocessing.Pool(processes=count, initializer=init_worker)
+  results = pool.map(plot_batch, params_list, chunksize=1)
+  pool.close()
+  pool.join()
+  
+  for params, ok in zip(params_list, results):
+    if not ok:
+      print("Plotting of run {} roi {}-{}-{}-{} failed".format(*params))
+  
+  # Let shell scripts and cron jobs detect failed plot jobs
+  if not all(results):
+    sys.exit(1)
@@ -0,0 +1,118 @@
+"""
+Export of the Hit and Track trees written by the PixelDUTAnalyzer into Parquet files.
+
+Every tree of a Histos-TJ2-*.root file is written into a separate Parquet file
+(Histos-TJ2-*-Hit.parquet, Histos-TJ2-*-Track.parquet). The columns are the
+branches of the tree (cellU_fit, cellV_fit, hasHit, maskedPixel, iEvt, residuals,
+charges, ...). The trees are read in chunks of entries with RDataFrame.AsNumpy
+and every chunk is written as one compressed row group with column statistics,
+so that readers can skip row groups outside of an ROI and load only the columns
+they need.
+
+The export needs the pyarrow package.
+
+Usage:
+
+python parquetexport.py --ifile root-files/Histos-TJ2-run826-run826--reco.root
+"""
+
+import os
+import ROOT
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+# Trees written by the PixelDUTAnalyzer
+treenames = ['Hit', 'Track']
+
+# Number of tree entries per row group
+rowgroupsize = 1000000
+
+
+def get_columns(tree):
+  """
+  Returns the names of all branches of a tree holding a single number per entry
+  """
+
+  columns = []
+  for leaf in tree.GetListOfLeaves():
+    if leaf.GetLen() == 1 and not leaf.GetLeafCount():
+      columns.append(leaf.GetName())
+  return columns
+
+
+def export_tree(filename, treename, outfile, columns=None, rowgroupsize=rowgroupsize, compression='zstd'):
+  """
+  Writes the columns of a tree into a Parquet file. By default, all single number
+  branches are written, requested columns missing in the tree are skipped.
+  Returns the number of exported entries.
+  """
+
+  if pyarrow is None:
+    raise ImportError("The Parquet export needs the pyarrow package")
+
+  rootfile = ROOT.TFile(filename, "READ")
+  tree = rootfile.Get(treename)
+  if columns is None:
+    columns = get_columns(tree)
+  else:
+    columns = [ column for column in columns if column in get_columns(tree) ]
+  nentries = int(tree.GetEntries())
+  rootfile.Close()
+
+  outdir = os.path.dirname(outfile)
+  if outdir:
+    os.makedirs(outdir, exist_ok=True)
+
+  # Write into a temporary file first, so that an interrupted export
+  # never leaves a partial Parquet file behind
+  tmpfile = outfile + '.tmp'
+  writer = None
+  for begin in range(0, nentries, rowgroupsize):
+    end = min(begin + rowgroupsize, nentries)
+    chunk = ROOT.RDataFrame(treename, filename).Range(begin, end).AsNumpy(columns)
+    table = pyarrow.Table.from_arrays([ pyarrow.array(chunk[column]) for column in columns ], names=columns)
+    if writer is None:
+      writer = pyarrow.parquet.ParquetWriter(tmpfile, table.schema, compression=compression, write_statistics=True)
+    writer.write_table(table, row_group_size=rowgroupsize)
+
+  if writer is None:
+    # Empty tree, write the schema only
+    table = pyarrow.Table.from_arrays([ pyarrow.array([], type=pyarrow.float64()) for column in columns ], names=columns)
+    writer = pyarrow.parquet.ParquetWriter(tmpfile, table.schema, compression=compression)
+  writer.close()
+
+  os.rename(tmpfile, outfile)
+  return nentries
+
+
+def export(filename, outdir=None, columns=None):
+  """
+  Exports the Hit and Track trees of a root file and returns the list of Parquet files
+  """
+
+  if outdir is None:
+    outdir = os.path.dirname(filename)
+  basename = os.path.splitext(os.path.basename(filename))[0]
+
+  outfiles = []
+  for treename in treenames:
+    outfile = os.path.join(outdir, '{}-{}.parquet'.format(basename, treename))
+    nentries = export_tree(filename, treename, outfile, columns=columns)
+    print("Exported {:d} entries of tree {} to {}".format(nentries, treename, outfile))
+    outfiles.append(outfile)
+  return outfiles
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description="Export Hit and Track trees into Parquet files")
+  parser.add_argument('--ifile', dest='ifile', type=str, help='Name of root file with Hit and Track trees')
+  parser.add_argument('--outdir', dest='outdir', default=None, type=str, help='Folder for the Parquet files (default: folder of the root file)')
+  parser.add_argument('--columns', dest='columns', default=None, nargs='+', type=str, help='Names of branches to export (default: all)')
+  args = parser.parse_args()
+
+  export(args.ifile, outdir=args.outdir, columns=args.columns)
@@ -0,0 +1,249 @@
+"""
+Hot pixel masking from a binary hit store.
+
+The HotPixelKiller processor in the mask path runs a full Marlin pass over the
+rawfile only to count the hits per pixel. This module computes the same pixel
+occupancies from the columns of a hit store (see rawhits.py) with numpy and
+applies the cuts of the HotPixelKiller:
+
+  MaskNormalized      if true, cut on the occupancy divided by the mean occupancy
+                      of all pixels of the sensor, otherwise cut on the occupancy
+  MaxOccupancy        mask pixels above this occupancy (hits per event)
+  MinOccupancy        mask pixels below this occupancy, negative values disable the cut
+  MaxNormedOccupancy  mask pixels above this normed occupancy
+  MinNormedOccupancy  mask pixels below this normed occupancy, negative values disable the cut
+  OfflineZSThreshold  hits with a charge below the threshold are not counted
+
+With stableEvents > 0, the masking stops early once the estimates have converged:
+the mask must not have changed during the last stableEvents events and at most a
+fraction maxUndecided of all pixels may be undecided. A pixel is undecided while
+its occupancy cut lies within the Poisson confidence interval of its hit count
+(confidence standard deviations).
+
+The masks are written into NoiseDB files with a histogram hDB_sensor<ID>_mask per
+sensor. Masked pixels have bin content 1. The number of columns and rows of every
+sensor is read from the gear file.
+
+Usage:
+
+python pixelmask.py --ifile run826.hits --gearfile steering-files/desy-tb/geoid1.xml
+"""
+
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+
+import rawhits
+
+# Default parameters of the HotPixelKiller processor
+defaults = {
+  'MaskNormalized':     True,
+  'MaxOccupancy':       0.001,
+  'MinOccupancy':       -1,
+  'MaxNormedOccupancy': 5,
+  'MinNormedOccupancy': -1,
+  'OfflineZSThreshold': 0,
+}
+
+# Number of events histogrammed at once
+chunksize = 100000
+
+# Width of the Poisson confidence interval of hit counts in standard deviations
+confidence = 3.0
+
+# Fraction of undecided pixels accepted for stopping early
+maxUndecided = 0.0001
+
+
+def read_matrices(gearfile):
+  """
+  Returns a dictionary mapping sensor IDs to the number of (columns, rows)
+  """
+
+  matrices = {}
+  for layer in ET.parse(gearfile).getroot().iter('layer'):
+    sensitive = layer.find('sensitive')
+    if sensitive is None:
+      continue
+    ncols = max( int(group.get('maxCell')) + 1 for group in layer.iter('uCellGroup') )
+    nrows = max( int(group.get('maxCell')) + 1 for group in layer.iter('vCellGroup') )
+    matrices[int(sensitive.get('ID'))] = (ncols, nrows)
+  return matrices
+
+
+def get_cuts(params):
+  """
+  Returns the masking cuts for a list of (name, value) HotPixelKiller parameters
+  """
+
+  cuts = dict(defaults)
+  for name, value in params:
+    if name in cuts:
+      cuts[name] = value
+  return cuts
+
+
+def iter_counts(store, matrices, threshold=0, maxevents=-1, chunksize=chunksize):
+  """
+  Generator over chunks of events in a hit store. Yields tuples (nevents, counts)
+  where counts maps sensor IDs to the number of hits per pixel (columns x rows)
+  in the first nevents events. The same count arrays are updated for every chunk.
+  """
+
+  nevents = len(store['event'])
+  if maxevents > 0:
+    nevents = min(nevents, maxevents)
+
+  counts = dict( (sensorID, np.zeros(ncols * nrows, dtype=np.int64)) for sensorID, (ncols, nrows) in matrices.items() )
+
+  for first in range(0, nevents, chunksize):
+    last = min(first + chunksize, nevents)
+    hits = rawhits.get_events(store, first, last)
+
+    selected = hits['charge'] >= threshold
+    for sensorID, (ncols, nrows) in matrices.items():
+      onsensor = selected & (hits['sensor'] == sensorID)
+      col = hits['col'][onsensor]
+      row = hits['row'][onsensor]
+      inside = (col >= 0) & (col < ncols) & (row >= 0) & (row < nrows)
+      counts[sensorID] += np.bincount(col[inside] * nrows + row[inside], minlength=ncols * nrows)
+
+    yield last, dict( (sensorID, counts[sensorID].reshape(matrices[sensorID])) for sensorID in matrices )
+
+
+def get_count_cuts(counts, nevents, cuts):
+  """
+  Returns the cuts on the hit count of a pixel in nevents events as a tuple
+  (maxCount, minCount). minCount is None if the lower cut is disabled.
+  """
+
+  if cuts['MaskNormalized']:
+    # Normed occupancies are relative to the mean hit count of the sensor
+    scale = counts.mean()
+    if scale <= 0:
+      scale = 1.0
+    maxOccupancy = cuts['MaxNormedOccupancy']
+    minOccupancy = cuts['MinNormedOccupancy']
+  else:
+    scale = float(nevents)
+    maxOccupancy = cuts['MaxOccupancy']
+    minOccupancy = cuts['MinOccupancy']
+
+  if minOccupancy < 0:
+    return maxOccupancy * scale, None
+  return maxOccupancy * scale, minOccupancy * scale
+
+
+def get_mask(counts, nevents, cuts):
+  """
+  Returns a boolean array of masked pixels for an array of hit counts in nevents events
+  """
+
+  maxCount, minCount = get_count_cuts(counts, nevents, cuts)
+
+  mask = counts > maxCount
+  if minCount is not None:
+    mask |= counts < minCount
+  return mask
+
+
+def count_undecided(counts, nevents, cuts, confidence=confidence):
+  """
+  Returns the number of pixels whose count cut lies inside the Poisson confidence
+  interval of their hit count
+  """
+
+  maxCount, minCount = get_count_cuts(counts, nevents, cuts)
+  error = confidence * np.sqrt(np.maximum(counts, 1))
+
+  undecided = np.abs(counts - maxCount) < error
+  if minCount is not None:
+    undecided |= np.abs(counts - minCount) < error
+  return int(undecided.sum())
+
+
+def write_noisedb(filename, masks):
+  """
+  Writes a NoiseDB file with a mask histogram for every sensor in masks
+  """
+
+  # Only the NoiseDB files need ROOT, the masking itself is plain numpy
+  from ROOT import TFile, TH2F
+
+  dbdir = os.path.dirname(filename)
+  if dbdir and not os.path.isdir(dbdir):
+    os.makedirs(dbdir)
+
+  rootfile = TFile(filename, "RECREATE")
+  for sensorID, mask in sorted(masks.items()):
+    ncols, nrows = mask.shape
+    histo = TH2F("hDB_sensor{:d}_mask".format(sensorID), "", ncols, 0, ncols, nrows, 0, nrows)
+    for col, row in zip(*np.nonzero(mask)):
+      histo.SetBinContent(int(col) + 1, int(row) + 1, 1)
+    histo.Write()
+  rootfile.Close()
+
+
+def build_noisedb(store, matrices, params, maxevents=-1, dbdir='', stableEvents=0):
+  """
+  Computes the masks for the sensors of one HotPixelKiller, given as a list of
+  (name, value) parameters including NoiseDBFileName, and writes the NoiseDB file.
+  With stableEvents > 0, the counting stops once the masks converged.
+  Returns a dictionary mapping sensor IDs to masks.
+  """
+
+  cuts = get_cuts(params)
+  filename = os.path.join(dbdir, dict(params)['NoiseDBFileName'])
+
+  masks = dict( (sensorID, np.zeros(matrix, dtype=bool)) for sensorID, matrix in matrices.items() )
+  npixels = sum( ncols * nrows for ncols, nrows in matrices.values() )
+  nevents = 0
+  stableSince = 0
+  for nevents, counts in iter_counts(store, matrices, threshold=cuts['OfflineZSThreshold'], maxevents=maxevents):
+    newmasks = dict( (sensorID, get_mask(counts[sensorID], nevents, cuts)) for sensorID in matrices )
+    if any( not np.array_equal(newmasks[sensorID], masks[sensorID]) for sensorID in matrices ):
+      stableSince = nevents
+    masks = newmasks
+
+    if stableEvents > 0 and nevents - stableSince >= stableEvents:
+      undecided = sum( count_undecided(counts[sensorID], nevents, cuts) for sensorID in matrices )
+      if undecided <= maxUndecided * npixels:
+        print("Masks converged after {:d} events with {:d} undecided pixels".format(nevents, undecided))
+        break
+
+  write_noisedb(filename, masks)
+
+  for sensorID in sorted(masks):
+    print("Masked {:d} pixels on sensor {:d} in {:d} events".format(int(masks[sensorID].sum()), sensorID, nevents))
+
+  return masks
+
+
+def build_noisedbs(hitstore, gearfile, masking, maxevents=-1, dbdir='', stableEvents=0):
+  """
+  Writes the NoiseDB files for a list of (name, sensorIDs, params) tuples as
+  returned by tj2_paths.get_pixelmasking(). The NoiseDB file names in params are
+  relative to dbdir.
+  """
+
+  store = rawhits.open_hitstore(hitstore)
+  matrices = read_matrices(gearfile)
+
+  for name, sensorIDs, params in masking:
+    selected = dict( (int(sensorID), matrices[int(sensorID)]) for sensorID in sensorIDs.split() )
+    build_noisedb(store, selected, params, maxevents=maxevents, dbdir=dbdir, stableEvents=stableEvents)
+
+
+if __name__ == '__main__':
+  import argparse
+  import tj2_paths
+  parser = argparse.ArgumentParser(description="Build NoiseDB files from a binary hit store")
+  parser.add_argument('--ifile', dest='ifile', type=str, help='Name of hit store folder')
+  parser.add_argument('--gearfile', dest='gearfile', type=str, help='Name of gearfile')
+  parser.add_argument('--setup', dest='setup', default='tj2', type=str, help='Name of setup in tj2_paths.setups')
+  parser.add_argument('--dbdir', dest='dbdir', default='', type=str, help='Folder for the localDB folder holding the NoiseDB files')
+  parser.add_argument('--stable', dest='stable', default=0, type=int, help='Stop once the masks did not change for this number of events, 0 processes all events')
+  args = parser.parse_args()
+
+  setup = tj2_paths.get_setup(args.setup)
+  build_noisedbs(args.ifile, args.gearfile, tj2_paths.get_pixelmasking(setup), maxevents=setup['maxRecordNrLong'], dbdir=args.dbdir, stableEvents=args.stable)
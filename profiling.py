@@ -0,0 +1,138 @@
+"""
+Profiling of tbsw paths.
+
+ProfiledEnv wraps a tbsw Simulation, Calibration or Reconstruction object. Its
+simulate(), calibrate() and reconstruct() methods run the paths one by one and
+record for every path:
+
+  wall           wall time in seconds
+  cpu            user and system cpu time of the Marlin job in seconds
+  maxrss_so_far  peak resident memory in kB of the largest Marlin job run by this
+                 process so far, not of this path alone (RUSAGE_CHILDREN only
+                 keeps the maximum over all finished children)
+  processors     time in processEvent() and number of events of every processor,
+                 parsed from the timing summary Marlin writes into the log files
+
+Marlin runs all processors of a path in one process and its timing summary only
+contains the time spent in processEvent() and the number of events. Wall time,
+cpu time and peak memory are therefore recorded per path, not per processor.
+
+All other attributes are passed to the wrapped object, so that a ProfiledEnv can
+be used wherever the tbsw object is used. write_report() stores the records as
+json and as csv with one row per processor.
+"""
+
+import os
+import re
+import csv
+import json
+import time
+import resource
+
+# Line of the Marlin timing summary:
+# '[ MESSAGE "Marlin"]  M26Clusterizer   1.23e+00 s in   1000 evts  ==>  1.23e-03 [ s/evt.]'
+_timing_line = re.compile(r'^(?:\[[^\]]*\])?\s*(\S+)\s+([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)\s+s in\s+(\d+)\s+evts')
+
+
+def parse_timing(logfile):
+  """
+  Returns a list of (processor, time, events) tuples from the timing summary in a Marlin log file
+  """
+
+  timing = []
+  with open(logfile, 'r') as f:
+    for line in f:
+      match = _timing_line.match(line)
+      # Skip the 'Total:' line summing up all processors
+      if match and match.group(1) != 'Total:':
+        timing.append( (match.group(1), float(match.group(2)), int(match.group(3))) )
+  return timing
+
+
+def _list_logs(folder):
+  """
+  Returns a dictionary mapping log files in folder to their mtime
+  """
+
+  logs = {}
+  if os.path.isdir(folder):
+    for dirpath, dirnames, filenames in os.walk(folder):
+      for filename in filenames:
+        if filename.endswith('.log'):
+          fullname = os.path.join(dirpath, filename)
+          logs[fullname] = os.stat(fullname).st_mtime_ns
+  return logs
+
+
+class ProfiledEnv(object):
+  """
+  Wrapper of a tbsw object recording the cost of every path it runs
+  """
+
+  def __init__(self, env, tmpdir):
+    self.env = env
+    self.tmpdir = tmpdir
+    self.records = []
+
+  def __getattr__(self, name):
+    return getattr(self.env, name)
+
+  def run_path(self, method, path, **kwargs):
+    """
+    Runs a single path with the method of the wrapped object and records its cost
+    """
+
+    logs = _list_logs(self.tmpdir)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+
+    getattr(self.env, method)(paths=[path], **kwargs)
+
+    wall = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # Logs written by this path
+    processors = []
+    for logfile, mtime in sorted(_list_logs(self.tmpdir).items()):
+      if logs.get(logfile) != mtime:
+        processors += [ {'name': name, 'time': cost, 'events': events} for name, cost, events in parse_timing(logfile) ]
+
+    record = {'path': path.name,
+              'wall': wall,
+              'cpu': (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime),
+              'maxrss_so_far': after.ru_maxrss,
+              'processors': processors}
+    self.records.append(record)
+    print("Profile {}: {:.1f} s wall, {:.1f} s cpu".format(path.name, record['wall'], record['cpu']))
+
+  def simulate(self, paths, **kwargs):
+    for path in paths:
+      self.run_path('simulate', path, **kwargs)
+
+  def calibrate(self, paths, **kwargs):
+    for path in paths:
+      self.run_path('calibrate', path, **kwargs)
+
+  def reconstruct(self, paths, **kwargs):
+    for path in paths:
+      self.run_path('reconstruct', path, **kwargs)
+
+  def write_report(self, basename):
+    """
+    Writes the records into basename.json and basename.csv
+    """
+
+    folder = os.path.dirname(basename)
+    if folder:
+      os.makedirs(folder, exist_ok=True)
+
+    with open(basename + '.json', 'w') as f:
+      json.dump(self.records, f, indent=2)
+
+    with open(basename + '.csv', 'w') as f:
+      writer = csv.writer(f)
+      writer.writerow(['step', 'path', 'processor', 'wall', 'cpu', 'maxrss_so_far', 'time', 'events'])
+      for step, record in enumerate(self.records):
+        writer.writerow([step, record['path'], '', record['wall'], record['cpu'], record['maxrss_so_far'], '', ''])
+        for processor in record['processors']:
+          writer.writerow([step, record['path'], processor['name'], '', '', '', processor['time'], processor['events']])
@@ -0,0 +1,230 @@
+"""
+Converter for CorryInputProcessor text raw files into a binary columnar hit store.
+
+The text dumps in --datapath are parsed once and written to a folder in the
+workspace (run826.txt -> hit-store/run826.hits/), so that the beam data area can
+stay read-only. The folder holds one numpy array per column:
+
+  event.npy    event number of every event
+  offsets.npy  index of the first hit of every event, plus the total number of hits
+  sensor.npy   sensor ID of every hit
+  col.npy      column of every hit
+  row.npy      row of every hit
+  charge.npy   charge of every hit
+
+The hits of event i are found in the index range offsets[i]:offsets[i+1]. All arrays
+are memory-mapped when the hit store is opened, so later passes over the run cost
+no text parsing.
+
+The text format is the one written by the Corryvreckan TextWriter: a line '=== N ==='
+starts event N, a line '--- NAME ---' selects the detector NAME and every line starting
+with 'Pixel' holds the column, row, raw value and charge of one pixel hit.
+
+Usage:
+
+python rawhits.py --ifile /home/bgnet/beam_data/text_files/run826.txt
+"""
+
+import os
+import re
+import shutil
+import array
+import numpy as np
+
+# Sensor IDs and names as configured for the CorryInputProcessor in tj2-reco.py
+sensorIDs = "0 1 2 3 4 5 22"
+sensorNames = "MIMOSA26_0 MIMOSA26_1 MIMOSA26_2 MIMOSA26_3 MIMOSA26_4 MIMOSA26_5 Monopix2_0"
+
+# Default folder holding the hit stores
+hitstoredir = 'hit-store'
+
+# Columns of the hit store: (name, numpy dtype, array typecode)
+columns = [ ('sensor', np.int16, 'h'), ('col', np.int32, 'i'), ('row', np.int32, 'i'), ('charge', np.float32, 'f') ]
+
+# Object type headers of the TextWriter, every other '--- NAME ---' header selects a detector
+objectTypes = ('Pixel', 'Cluster', 'Track', 'Event', 'MCParticle', 'Vertex', 'SpidrSignal')
+
+_event_line = re.compile(r'^===\s*(\d+)\s*===')
+_detector_line = re.compile(r'^---\s*(\S+)\s*---')
+_number = re.compile(r'[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?')
+
+
+def get_hitstore_name(rawfile, hitstoredir=hitstoredir):
+  """
+  Returns the name of the hit store folder belonging to a text rawfile
+  """
+  return os.path.join(hitstoredir, os.path.splitext(os.path.basename(rawfile))[0] + '.hits')
+
+
+def read_textfile(txtfile, sensorIDs=sensorIDs, sensorNames=sensorNames):
+  """
+  Generator over all events in a text rawfile. Yields tuples (eventNumber, hits)
+  where hits is a list of (sensorID, col, row, charge) tuples.
+  """
+
+  sensorMap = dict(zip(sensorNames.split(), [int(i) for i in sensorIDs.split()]))
+
+  eventNumber = None
+  sensorID = None
+  hits = []
+
+  with open(txtfile, 'r') as f:
+    for line in f:
+
+      match = _event_line.match(line)
+      if match:
+        if eventNumber is not None:
+          yield eventNumber, hits
+        eventNumber = int(match.group(1))
+        sensorID = None
+        hits = []
+        continue
+
+      match = _detector_line.match(line)
+      if match:
+        # Object type headers like '--- Pixel ---' keep the current detector,
+        # hits of detectors missing in sensorNames are skipped
+        if match.group(1) not in objectTypes:
+          sensorID = sensorMap.get(match.group(1))
+        continue
+
+      if line.startswith('Pixel') and sensorID is not None:
+        values = _number.findall(line)
+        if len(values) < 4:
+          continue
+        hits.append( (sensorID, int(values[0]), int(values[1]), float(values[3])) )
+
+  if eventNumber is not None:
+    yield eventNumber, hits
+
+
+def convert(txtfile, hitstore=None, sensorIDs=sensorIDs, sensorNames=sensorNames):
+  """
+  Converts a text rawfile into a binary hit store and returns the name of the hit store
+  """
+
+  if hitstore is None:
+    hitstore = get_hitstore_name(txtfile)
+
+  events = array.array('q')
+  offsets = array.array('q', [0])
+  buffers = dict( (name, array.array(typecode)) for name, dtype, typecode in columns )
+
+  for eventNumber, hits in read_textfile(txtfile, sensorIDs=sensorIDs, sensorNames=sensorNames):
+    events.append(eventNumber)
+    for sensorID, col, row, charge in hits:
+      buffers['sensor'].append(sensorID)
+      buffers['col'].append(col)
+      buffers['row'].append(row)
+      buffers['charge'].append(charge)
+    offsets.append(len(buffers['sensor']))
+
+  # Write into a temporary folder first, so that an interrupted
+  # conversion never leaves a partial hit store behind
+  tmpstore = hitstore + '.tmp'
+  if os.path.isdir(tmpstore):
+    shutil.rmtree(tmpstore)
+  os.makedirs(tmpstore)
+
+  np.save(os.path.join(tmpstore, 'event.npy'), np.frombuffer(events, dtype=np.int64))
+  np.save(os.path.join(tmpstore, 'offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
+  for name, dtype, typecode in columns:
+    np.save(os.path.join(tmpstore, name + '.npy'), np.frombuffer(buffers[name], dtype=dtype))
+
+  if os.path.isdir(hitstore):
+    shutil.rmtree(hitstore)
+  os.rename(tmpstore, hitstore)
+
+  return hitstore
+
+
+def open_hitstore(hitstore):
+  """
+  Returns a dictionary of memory-mapped arrays for all columns of a hit store
+  """
+
+  store = {}
+  for name in ['event', 'offsets'] + [ column[0] for column in columns ]:
+    store[name] = np.load(os.path.join(hitstore, name + '.npy'), mmap_mode='r')
+  return store
+
+
+def get_events(store, first, last):
+  """
+  Returns a dictionary with the hit columns of events in the range [first, last)
+  """
+
+  begin = store['offsets'][first]
+  end = store['offsets'][last]
+  return dict( (column[0], store[column[0]][begin:end]) for column in columns )
+
+
+def split_textfile(txtfile, nshards, outdir, maxevents=-1):
+  """
+  Splits a text rawfile into nshards text rawfiles covering consecutive event ranges
+  and returns the list of their names in event order. Lines in front of the first
+  event are copied into every shard. With maxevents > 0, only the first maxevents
+  events are distributed. Raises ValueError for a rawfile without events.
+  """
+
+  # First pass: count events
+  nevents = 0
+  with open(txtfile, 'r') as f:
+    for line in f:
+      if _event_line.match(line):
+        nevents += 1
+
+  if maxevents > 0:
+    nevents = min(nevents, maxevents)
+  if nevents == 0:
+    raise ValueError("Rawfile {} holds no events to split".format(txtfile))
+  nshards = min(nshards, nevents)
+
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+
+  # Shard i gets the events [bounds[i], bounds[i+1])
+  bounds = [ (nevents * i) // nshards for i in range(nshards + 1) ]
+  basename, ext = os.path.splitext(os.path.basename(txtfile))
+  shardfiles = [ os.path.join(outdir, '{}-shard{:d}{}'.format(basename, i, ext)) for i in range(nshards) ]
+
+  # Second pass: copy events into shards
+  preamble = []
+  ievent = -1
+  ishard = -1
+  out = None
+  with open(txtfile, 'r') as f:
+    for line in f:
+      if _event_line.match(line):
+        ievent += 1
+        if ievent >= nevents:
+          break
+        if ievent == bounds[ishard + 1]:
+          if out is not None:
+            out.close()
+          ishard += 1
+          out = open(shardfiles[ishard], 'w')
+          out.writelines(preamble)
+      if out is None:
+        preamble.append(line)
+      else:
+        out.write(line)
+
+  if out is not None:
+    out.close()
+
+  return shardfiles
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description="Convert a text rawfile into a binary columnar hit store")
+  parser.add_argument('--ifile', dest='ifile', type=str, help='Name of text rawfile')
+  parser.add_argument('--ofile', dest='ofile', default=None, type=str, help='Name of hit store folder (default: {}/rawfile with extension .hits)'.format(hitstoredir))
+  parser.add_argument('--sensorIDs', dest='sensorIDs', default=sensorIDs, type=str, help='Sensor IDs of the CorryInputProcessor')
+  parser.add_argument('--sensorNames', dest='sensorNames', default=sensorNames, type=str, help='Sensor names of the CorryInputProcessor')
+  args = parser.parse_args()
+
+  hitstore = convert(args.ifile, args.ofile, sensorIDs=args.sensorIDs, sensorNames=args.sensorNames)
+  store = open_hitstore(hitstore)
+  print("Converted {:d} events with {:d} hits into {}".format(len(store['event']), int(store['offsets'][-1]), hitstore))
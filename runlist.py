@@ -0,0 +1,21 @@
+"""
+Parsing of run lists given on the command line, shared by the reco and plotting scripts.
+"""
+
+
+def parse_runlist(runlist):
+  """
+  Returns a list of run numbers from a string like '826,830-835'
+  """
+
+  runs = []
+  for item in runlist.split(','):
+    item = item.strip()
+    if item == '':
+      continue
+    if '-' in item:
+      first, last = item.split('-')
+      runs.extend(range(int(first), int(last)+1))
+    else:
+      runs.append(int(item))
+  return runs
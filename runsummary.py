@@ -0,0 +1,87 @@
+"""
+Run summary of the Hit/Track trees written by the PixelDUTAnalyzer.
+
+After the reconstruction, a summary of the run is stored as json string in the
+title of a TNamed object 'RunSummary' in the root file:
+
+  nHits           number of entries in the Hit tree
+  nTracks         number of entries in the Track tree
+  firstEvent      smallest iEvt in the Hit and Track trees
+  lastEvent       largest iEvt in the Hit and Track trees
+  lastHitEvent    largest iEvt in the Hit tree, -1 for an empty tree
+  lastTrackEvent  largest iEvt in the Track tree, -1 for an empty tree
+
+The analyzer fills both trees in event order, so iEvt never decreases with the
+entry number. The summary is computed from the first and last entries and the
+first entry of an event range is found by bisection, without scanning a branch.
+"""
+
+import json
+import ROOT
+
+
+def get_iEvt(tree, entry):
+  """
+  Returns the iEvt of an entry, reading only the iEvt branch
+  """
+  tree.GetBranch("iEvt").GetEntry(entry)
+  return int(tree.GetLeaf("iEvt").GetValue())
+
+
+def find_first_entry(tree, iEvt):
+  """
+  Returns the first entry of tree with an event number of at least iEvt
+  """
+
+  first = 0
+  last = tree.GetEntries()
+  while first < last:
+    middle = (first + last) // 2
+    if get_iEvt(tree, middle) < iEvt:
+      first = middle + 1
+    else:
+      last = middle
+  return first
+
+
+def compute(inputfile):
+  """
+  Returns the summary of the Hit and Track trees in inputfile
+  """
+
+  summary = {}
+  events = []
+  for name, key, lastkey in [ ("Hit", "nHits", "lastHitEvent"), ("Track", "nTracks", "lastTrackEvent") ]:
+    tree = inputfile.Get(name)
+    summary[key] = int(tree.GetEntries())
+    summary[lastkey] = -1
+    if tree.GetEntries() > 0:
+      summary[lastkey] = get_iEvt(tree, tree.GetEntries() - 1)
+      events += [ get_iEvt(tree, 0), summary[lastkey] ]
+
+  summary['firstEvent'] = min(events) if events else -1
+  summary['lastEvent'] = max(events) if events else -1
+  return summary
+
+
+def write(filename):
+  """
+  Computes the run summary of a root file and stores it in the file
+  """
+
+  rootfile = ROOT.TFile(filename, "UPDATE")
+  summary = compute(rootfile)
+  ROOT.TNamed("RunSummary", json.dumps(summary, sort_keys=True)).Write("RunSummary", ROOT.TObject.kOverwrite)
+  rootfile.Close()
+  return summary
+
+
+def read(inputfile):
+  """
+  Returns the run summary stored in inputfile, or None for files without summary
+  """
+
+  named = inputfile.Get("RunSummary")
+  if not named:
+    return None
+  return json.loads(named.GetTitle())
@@ -0,0 +1,108 @@
+"""
+Tests for the hot pixel masking with numpy in pixelmask.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pixelmask
+
+
+def make_store(events):
+  """
+  Returns a hit store dictionary for a list of events, every event a list of (sensor, col, row, charge) hits
+  """
+
+  offsets = np.cumsum([0] + [ len(hits) for hits in events ])
+  hits = [ hit for event in events for hit in event ]
+  return {'event': np.arange(len(events)),
+          'offsets': offsets,
+          'sensor': np.array([ hit[0] for hit in hits ], dtype=np.int16),
+          'col': np.array([ hit[1] for hit in hits ], dtype=np.int32),
+          'row': np.array([ hit[2] for hit in hits ], dtype=np.int32),
+          'charge': np.array([ hit[3] for hit in hits ], dtype=np.float32)}
+
+
+def test_get_cuts_overrides_defaults():
+  cuts = pixelmask.get_cuts([ ('MaxOccupancy', 0.01), ('NoiseDBFileName', 'localDB/NoiseDB-M26.root') ])
+  assert cuts['MaxOccupancy'] == 0.01
+  assert cuts['MaskNormalized'] == pixelmask.defaults['MaskNormalized']
+  assert 'NoiseDBFileName' not in cuts
+
+
+def test_absolute_occupancy_cut():
+  cuts = pixelmask.get_cuts([ ('MaskNormalized', False), ('MaxOccupancy', 0.1) ])
+  counts = np.array([[0, 5], [10, 20]])
+
+  # 100 events: pixels with more than 10 hits are masked
+  mask = pixelmask.get_mask(counts, 100, cuts)
+  assert mask.tolist() == [[False, False], [False, True]]
+
+
+def test_normalized_occupancy_cut():
+  cuts = pixelmask.get_cuts([ ('MaskNormalized', True), ('MaxNormedOccupancy', 2) ])
+  counts = np.array([[1, 1], [1, 9]])
+
+  # Mean count 3: pixels with more than 6 hits are masked
+  mask = pixelmask.get_mask(counts, 100, cuts)
+  assert mask.tolist() == [[False, False], [False, True]]
+
+
+def test_min_cut_disabled():
+  counts = np.array([[0, 5], [5, 5]])
+
+  disabled = pixelmask.get_cuts([ ('MaskNormalized', False), ('MaxOccupancy', 1), ('MinOccupancy', -1) ])
+  assert pixelmask.get_count_cuts(counts, 100, disabled)[1] is None
+  assert not pixelmask.get_mask(counts, 100, disabled).any()
+
+  enabled = pixelmask.get_cuts([ ('MaskNormalized', False), ('MaxOccupancy', 1), ('MinOccupancy', 0.01) ])
+  assert pixelmask.get_mask(counts, 100, enabled).tolist() == [[True, False], [False, False]]
+
+
+def test_offline_zs_threshold():
+  store = make_store([ [ (0, 0, 0, 1.0), (0, 1, 1, 10.0) ],
+                       [ (0, 0, 0, 2.0), (0, 1, 1, 10.0), (1, 0, 0, 10.0) ] ])
+  matrices = {0: (2, 2)}
+
+  nevents, counts = list(pixelmask.iter_counts(store, matrices, threshold=5))[-1]
+  assert nevents == 2
+  assert counts[0].tolist() == [[0, 0], [0, 2]]
+
+  nevents, counts = list(pixelmask.iter_counts(store, matrices, threshold=0))[-1]
+  assert counts[0].tolist() == [[2, 0], [0, 2]]
+
+
+def make_hot_pixel_store(nevents):
+  # Pixel (0,0) fires in every event, pixel (1,1) in every 10th event
+  return make_store([ [ (0, 0, 0, 1.0) ] + ( [ (0, 1, 1, 1.0) ] if i % 10 == 0 else [] ) for i in range(nevents) ])
+
+
+def test_early_stop(monkeypatch):
+  monkeypatch.setattr(pixelmask, 'chunksize', 100)
+  monkeypatch.setattr(pixelmask, 'maxUndecided', 0.5)
+  monkeypatch.setattr(pixelmask, 'write_noisedb', lambda filename, masks: None)
+  params = [ ('MaskNormalized', False), ('MaxOccupancy', 0.5), ('NoiseDBFileName', 'localDB/NoiseDB.root') ]
+
+  # iter_counts binds chunksize at definition time, pass it explicitly
+  counted = []
+  iter_counts = pixelmask.iter_counts
+  def counting(*args, **kwargs):
+    kwargs['chunksize'] = 100
+    for nevents, counts in iter_counts(*args, **kwargs):
+      counted.append(nevents)
+      yield nevents, counts
+  monkeypatch.setattr(pixelmask, 'iter_counts', counting)
+
+  masks = pixelmask.build_noisedb(make_hot_pixel_store(2000), {0: (2, 2)}, params, stableEvents=300)
+  assert masks[0].tolist() == [[True, False], [False, False]]
+  # The mask is stable from the first chunk on, counting stops after 300 more events
+  assert counted[-1] == 400
+
+  counted[:] = []
+  masks = pixelmask.build_noisedb(make_hot_pixel_store(2000), {0: (2, 2)}, params, stableEvents=0)
+  assert masks[0].tolist() == [[True, False], [False, False]]
+  assert counted[-1] == 2000
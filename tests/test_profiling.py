@@ -0,0 +1,32 @@
+"""
+Tests for the parsing of the Marlin timing summary in profiling.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import profiling
+
+datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def test_parse_timing():
+  timing = profiling.parse_timing(os.path.join(datadir, 'marlin-reco.log'))
+
+  names = [ name for name, cost, events in timing ]
+  assert names == ['CorryInputProcessor', 'Geo', 'TelUnpacker', 'TJ2Unpacker', 'M26Clusterizer',
+                   'TJ2Clusterizer', 'M26GoeHitMaker', 'TJ2GoeHitMaker', 'TrackFinder', 'TJ2Analyzer',
+                   'LCIOOutput']
+  assert ('M26Clusterizer', 1.23, 1000) in timing
+  assert ('TrackFinder', 14.8763, 1000) in timing
+  assert ('LCIOOutput', 0.0, 0) in timing
+
+
+def test_parse_timing_skips_total_and_messages():
+  timing = profiling.parse_timing(os.path.join(datadir, 'marlin-reco.log'))
+
+  names = [ name for name, cost, events in timing ]
+  assert 'Total:' not in names
+  assert 'Number' not in names
@@ -0,0 +1,81 @@
+"""
+Tests for the text rawfile parsing and splitting in rawhits.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rawhits
+
+
+def write_rawfile(tmp_path, text):
+  rawfile = tmp_path / 'run000001.txt'
+  rawfile.write_text(text)
+  return str(rawfile)
+
+
+def test_read_textfile_skips_unknown_detectors(tmp_path):
+  rawfile = write_rawfile(tmp_path, '=== 1 ===\n'
+                                    '--- MIMOSA26_0 ---\n'
+                                    '--- Pixel ---\n'
+                                    'Pixel 10, 20, 1, 1.0\n'
+                                    '--- OtherDUT_0 ---\n'
+                                    '--- Pixel ---\n'
+                                    'Pixel 11, 21, 1, 1.0\n'
+                                    'Pixel 12, 22, 1, 1.0\n'
+                                    '--- Monopix2_0 ---\n'
+                                    '--- Pixel ---\n'
+                                    'Pixel 13, 23, 5, 5.0\n')
+
+  events = list(rawhits.read_textfile(rawfile))
+  assert events == [ (1, [ (0, 10, 20, 1.0), (22, 13, 23, 5.0) ]) ]
+
+
+def make_events(numbers):
+  return ''.join( '=== {:d} ===\n--- MIMOSA26_0 ---\n--- Pixel ---\nPixel {:d}, 1, 1, 1.0\n'.format(n, n) for n in numbers )
+
+
+def read_events(shardfile):
+  with open(shardfile) as f:
+    return [ int(line.split()[1]) for line in f if line.startswith('===') ]
+
+
+def test_split_textfile_shard_boundaries(tmp_path):
+  preamble = '# Header line\n# Second header line\n'
+  rawfile = write_rawfile(tmp_path, preamble + make_events(range(5)))
+
+  shardfiles = rawhits.split_textfile(rawfile, 2, str(tmp_path / 'shards'))
+  assert [ os.path.basename(shardfile) for shardfile in shardfiles ] == [ 'run000001-shard0.txt', 'run000001-shard1.txt' ]
+  assert [ read_events(shardfile) for shardfile in shardfiles ] == [ [0, 1], [2, 3, 4] ]
+
+  # Every shard starts with the preamble and holds complete events
+  for shardfile in shardfiles:
+    with open(shardfile) as f:
+      text = f.read()
+    assert text.startswith(preamble + '=== ')
+    assert text.count('\nPixel ') == len(read_events(shardfile))
+
+
+def test_split_textfile_maxevents(tmp_path):
+  rawfile = write_rawfile(tmp_path, make_events(range(10)))
+
+  shardfiles = rawhits.split_textfile(rawfile, 3, str(tmp_path / 'shards'), maxevents=7)
+  assert [ read_events(shardfile) for shardfile in shardfiles ] == [ [0, 1], [2, 3], [4, 5, 6] ]
+
+
+def test_split_textfile_more_shards_than_events(tmp_path):
+  rawfile = write_rawfile(tmp_path, make_events(range(2)))
+
+  shardfiles = rawhits.split_textfile(rawfile, 4, str(tmp_path / 'shards'))
+  assert [ read_events(shardfile) for shardfile in shardfiles ] == [ [0], [1] ]
+
+
+def test_split_textfile_without_events(tmp_path):
+  rawfile = write_rawfile(tmp_path, '# Header line\n')
+
+  with pytest.raises(ValueError):
+    rawhits.split_textfile(rawfile, 2, str(tmp_path / 'shards'))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Throughput benchmark for the processing stages of the tj2 reco scripts.
+
+The script simulates test beam runs with the tj2 telescope geometries (geoid1/2/3)
+at a configurable beam intensity using the ParticleGun/FastSimulation chain. The
+simulated digits of all sensors are written into the collection rawdata, just as
+the CorryInputProcessor does for beam data. The stages of tj2_paths.py are then
+run on the simulated run as separate Marlin jobs:
+
+  read        LCIO input and geometry only
+  unpack      read + HitsFilterProcessor unpackers
+  mask        unpack + HotPixelKillers
+  clusterize  unpack + PixelClusterizers
+  coghits     clusterize + CogHitMakers
+  tracking    coghits + FastTracker of the reconstruction
+  aligner     coghits + alignment FastTracker + KalmanAligner
+  analyzer    tracking + PixelDUTAnalyzer (full reconstruction)
+
+Every stage adds processors to a smaller stage. The isolated cost of a stage is
+its wall time minus the wall time of that smaller stage. The analyzer stage gives
+the end-to-end throughput of the reconstruction.
+
+Results are written to a json file. With --baseline, the events per second of
+every stage are compared to an earlier result file with the same setup, energy,
+gear file, intensity and number of events, and the script exits with
+status 1 if a stage got slower than the tolerance allows.
+
+Usage:
+
+python3 tj2-benchmark.py --gearfiles geoid1.xml geoid2.xml geoid3.xml --intensity 2000 --nevents 100000
+
+python3 tj2-benchmark.py --ofile benchmark-new.json --baseline benchmark-old.json
+"""
+
+from tbsw.tbsw import Simulation, Calibration, Processor
+import tj2_paths
+import os
+import sys
+import shutil
+import json
+import time
+import resource
+import argparse
+
+# Stages of the benchmark as (name, smaller stage)
+stages = [ ('read', None),
+           ('unpack', 'read'),
+           ('mask', 'unpack'),
+           ('clusterize', 'unpack'),
+           ('coghits', 'clusterize'),
+           ('tracking', 'coghits'),
+           ('aligner', 'coghits'),
+           ('analyzer', 'tracking') ]
+
+
+def create_sim_path(Env, gearfile, simfile, setup, nevents, intensity):
+  """
+  Returns a list of tbsw path objects to simulate a tj2 test beam run
+  """
+
+  sim_path = Env.create_path('sim')
+  sim_path.set_globals(params={'GearXMLFile': gearfile , 'MaxRecordNumber' : nevents})
+
+  infosetter = Processor(name="InfoSetter", proctype='EventInfoSetter')
+  infosetter.param("RunNumber","0")
+  infosetter.param("DetectorName","EUTelescope")
+  sim_path.add_processor(infosetter)
+
+  geo_noalign = Processor(name="Geo",proctype="Geometry")
+  geo_noalign.param("AlignmentDBFilePath", "localDB/alignmentDB.root")
+  geo_noalign.param("ApplyAlignment", "false")
+  geo_noalign.param("OverrideAlignment", "true")
+  sim_path.add_processor(geo_noalign)
+
+  gun = Processor(name="ParticleGun",proctype="ParticleGunGenerator")
+  gun.param("BeamIntensity", intensity)
+  gun.param("BeamMomentum", setup['energy'])
+  gun.param("BeamVertexX","0")
+  gun.param("BeamVertexY","0")
+  gun.param("BeamVertexZ","-10")
+  gun.param("BeamVertexXSigma","7")
+  gun.param("BeamVertexYSigma","7")
+  gun.param("PDG","11")
+  gun.param("ParticleCharge","-1")
+  gun.param("ParticleMass", setup['mass'])
+  sim_path.add_processor(gun)
+
+  fastsim = Processor(name="FastSim",proctype="FastSimulation")
+  fastsim.param("ScatterModel","0")
+  fastsim.param("DoEnergyLossStraggling","true")
+  fastsim.param("DoFractionalBetheHeitlerEnergyLoss","false")
+  sim_path.add_processor(fastsim)
+
+  tlu = Processor(name="TLU",proctype="TriggerGenerator")
+  tlu.param("FakeTriggerPeriod","0")
+  tlu.param("ScinitNo1", "0 -5 -5 5 5")
+  tlu.param("ScinitNo2", "")
+  tlu.param("ScinitNo3", "")
+  tlu.param("ScinitNo4", "")
+  sim_path.add_processor(tlu)
+
+  # Binary readout for all sensors, the unpackers split the digits by sensor ID
+  digi = Processor(name="Digitizer",proctype="SiPixDigitizer")
+  digi.param("DigitCollectionName","rawdata")
+  digi.param("NoiseFraction","0.00001")
+  digi.param("FrontEndType","1")
+  digi.param("ComparatorThrehold","800")
+  digi.param("ElectronicNoise","300")
+  digi.param("FilterIDs", setup['sensorIDs'])
+  digi.param("IntegrationWindow","true")
+  digi.param("StartIntegration","0")
+  digi.param("StopIntegration","100000")
+  digi.param("uSideBorderLength","4")
+  digi.param("vSideBorderLength","4")
+  sim_path.add_processor(digi)
+
+  lciooutput = Processor(name="LCIOOutput",proctype="LCIOOutputProcessor")
+  lciooutput.param("LCIOOutputFile", simfile)
+  lciooutput.param("LCIOWriteMode","WRITE_NEW")
+  sim_path.add_processor(lciooutput)
+
+  return [ sim_path ]
+
+
+def create_stage_path(Env, stage, gearfile, simfile, setup, nevents):
+  """
+  Returns a tbsw path object running the processors of a benchmark stage
+  """
+
+  names = [ name for name, smaller in stages ]
+  level = names.index(stage)
+
+  path = Env.create_path(stage + '_path')
+  path.set_globals(params=tj2_paths.get_globals(setup, gearfile, nevents, inputfile=simfile))
+  path.add_processor(tj2_paths.create_geometry())
+
+  if level >= names.index('unpack'):
+    path = tj2_paths.add_unpackers(path, setup)
+  if stage == 'mask':
+    path = tj2_paths.add_pixelmaskers(path, setup)
+  if level >= names.index('clusterize'):
+    path = tj2_paths.add_clusterizers(path, setup)
+  if level >= names.index('coghits'):
+    path = tj2_paths.add_hitmakers(path, setup)
+  if stage in ('tracking', 'analyzer'):
+    path.add_processor(tj2_paths.create_reco_trackfinder(setup))
+  if stage == 'aligner':
+    path.add_processor(tj2_paths.create_alignment_trackfinder(setup, "AlignTF_TC", 100, 20, "0.4"))
+    path.add_processor(tj2_paths.create_aligner("Aligner", setup['alignerErrors']))
+  if stage == 'analyzer':
+    path.add_processor(tj2_paths.create_dut_analyzer(setup, 'benchmark'))
+
+  return path
+
+
+def get_cputime():
+  """
+  Returns the cpu time used by all finished child processes
+  """
+
+  usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return usage.ru_utime + usage.ru_stime
+
+
+def run_benchmark(steerfiles, gearfile, setupname, setup, nevents, intensity):
+  """
+  Simulates a run with gearfile and returns a dictionary with the timing of all stages
+  """
+
+  # The simulated run is reused by later benchmarks with the same settings
+  name = 'benchmark-{}-{}-{}GeV-{}-{}'.format(setupname, os.path.splitext(gearfile)[0], setup['energy'], intensity, nevents)
+  simfile = os.path.join(os.getcwd(), 'benchmark-files', name + '.slcio')
+
+  if not os.path.isfile(simfile):
+    if not os.path.isdir(os.path.dirname(simfile)):
+      os.makedirs(os.path.dirname(simfile))
+    SimObj = Simulation(steerfiles=steerfiles, name=name + '-sim')
+    SimObj.simulate(paths=create_sim_path(SimObj, gearfile, simfile, setup, nevents, intensity))
+
+  # All stages run in the same folder, so that the mask stage provides the
+  # NoiseDB files for the clusterizers
+  BenchObj = Calibration(steerfiles=steerfiles, name=name)
+
+  # The DB files of the stages are of no use after the benchmark
+  caltag = '{}-tmp{:d}'.format(name, os.getpid())
+
+  results = {}
+  try:
+    for stage, smaller in stages:
+      path = create_stage_path(BenchObj, stage, gearfile, simfile, setup, nevents)
+
+      start = time.time()
+      cpustart = get_cputime()
+      BenchObj.calibrate(paths=[path], ifile=simfile, caltag=caltag)
+      wall = time.time() - start
+      cpu = get_cputime() - cpustart
+
+      results[stage] = {'wall': wall, 'cpu': cpu, 'eventsPerSecond': nevents / wall}
+      if smaller is not None:
+        results[stage]['isolatedWall'] = wall - results[smaller]['wall']
+      print("Stage {:<10} {:8.1f} s wall {:8.1f} s cpu {:10.1f} events/s".format(stage, wall, cpu, nevents / wall))
+  finally:
+    if os.path.isdir(os.path.join('localDB', caltag)):
+      shutil.rmtree(os.path.join('localDB', caltag))
+
+  return {'name': name, 'setup': setupname, 'energy': setup['energy'], 'gearfile': gearfile, 'intensity': intensity, 'nevents': nevents, 'stages': results}
+
+
+def compare(results, baseline, tolerance):
+  """
+  Returns a list of (benchmark, stage, eventsPerSecond, baseline eventsPerSecond)
+  for all stages slower than the baseline by more than the fraction tolerance
+  """
+
+  regressions = []
+  for key, result in sorted(results.items()):
+    if key not in baseline:
+      print("No baseline for benchmark {}".format(key))
+      continue
+    for stage, timing in sorted(result['stages'].items()):
+      if stage not in baseline[key]['stages']:
+        continue
+      reference = baseline[key]['stages'][stage]['eventsPerSecond']
+      if timing['eventsPerSecond'] < reference * (1 - tolerance):
+        regressions.append( (key, stage, timing['eventsPerSecond'], reference) )
+  return regressions
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser(description="Measure the throughput of the tj2 processing stages on simulated runs")
+  parser.add_argument('--steerfiles', dest='steerfiles', default='steering-files/desy-tb/', type=str, help='Path to steerfiles')
+  parser.add_argument('--gearfiles', dest='gearfiles', default=['geoid1.xml', 'geoid2.xml', 'geoid3.xml'], nargs='+', type=str, help='Names of gearfiles inside steerfiles folder')
+  parser.add_argument('--setup', dest='setup', default='tj2', type=str, help='Name of setup in tj2_paths.setups')
+  parser.add_argument('--intensity', dest='intensity', default=2000, type=int, help='Beam intensity of the particle gun')
+  parser.add_argument('--nevents', dest='nevents', default=100000, type=int, help='Number of simulated events')
+  parser.add_argument('--ofile', dest='ofile', default='tj2-benchmark.json', type=str, help='Name of json file for the results')
+  parser.add_argument('--baseline', dest='baseline', default='', type=str, help='Name of json file with baseline results to compare with')
+  parser.add_argument('--tolerance', dest='tolerance', default=0.1, type=float, help='Accepted fraction of throughput loss compared to the baseline')
+  args = parser.parse_args()
+
+  setup = tj2_paths.get_setup(args.setup)
+
+  results = {}
+  for gearfile in args.gearfiles:
+    print("Benchmark ", gearfile)
+    # Benchmarks are only compared with baselines of the same settings
+    result = run_benchmark(args.steerfiles, gearfile, args.setup, setup, args.nevents, args.intensity)
+    results[result['name']] = result
+
+  with open(args.ofile, 'w') as f:
+    json.dump(results, f, indent=2, sort_keys=True)
+  print("Results written to ", args.ofile)
+
+  if args.baseline != '':
+    with open(args.baseline, 'r') as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for key, stage, rate, reference in regressions:
+      print("Regression in {} stage {}: {:.1f} events/s (baseline {:.1f} events/s)".format(key, stage, rate, reference))
+    if regressions:
+      sys.exit(1)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Script for processing tj2 testbeam June/July 2022 at Desy. 
+
+This script calibrates and reconstructs a run for both telescope arms. The 
+rawfile is unpacked, masked and clusterized only once. The alignment and 
+reconstruction of the first arm (setup 'first-arm') and of the second arm 
+(setup 'second-arm') continue from the same clusters and run in parallel. 
+
+The shared steps are handed to the arms as checkpoints of every calibration 
+step in cal-checkpoints/, including the LCIO intermediates like tmp.slcio. 
+They need as much disk space as the tmp-runs folder of a calibration and are 
+removed when both arms are done. With --checkpoint they are kept for later 
+runs. With --fastmask, the NoiseDB files are built once and copied to the arms. 
+
+The caltags are <run><prefix>_first-arm and <run><prefix>_second-arm.
+
+Usage: 
+
+python3 tj2-reco-both-arms.py   --runno $run  --gearfile $gearfile 
+
+
+To activate the clusterderDB for position reconstruction instead of center of gravity, 
+run command with prefix "_clustdb"
+
+python3 tj2-reco-both-arms.py   --runno $run  --gearfile $gearfile --prefix _clustdb
+
+Author: Benjamin Schwenker <benjamin.schwenker@phys.uni-goettingen.de>  
+"""
+
+import tj2_workflow
+
+if __name__ == '__main__':
+  tj2_workflow.main('first-arm', telescopeArms=['first-arm', 'second-arm'])
@@ -0,0 +1,736 @@
+"""
+Path builder for the calibration and reconstruction of tj2 test beam runs.
+
+The scripts tj2-reco.py, tj2-reco_23repo.py, tj2-reco-first-arm.py and
+tj2-reco-second-arm.py process runs with the same sequence of mask, clusterizer,
+alignment and reconstruction paths. They only differ in a handful of parameters
+which are collected in the dictionary setups below. Every setup lists only the
+parameters which differ from the defaults.
+"""
+
+from tbsw.tbsw import Processor
+import os
+import re
+
+# Parameters of the default setup (tj2-reco.py)
+defaults = {
+  # Beam energy in GeV and particle mass
+  'energy':                 5.6,
+  'mass':                   0.000511,
+  # Number of events for long and short calibration passes and reconstruction
+  'maxRecordNrLong':        1000000,
+  'maxRecordNrShort':       200000,
+  # Marlin verbosity for paths reading the rawfile, None for Marlin default
+  'verbosity':              "MESSAGE1",
+  # Sensors in the text rawfile
+  'sensorIDs':              "0 1 2 3 4 5 22",
+  'sensorNames':            "MIMOSA26_0 MIMOSA26_1 MIMOSA26_2 MIMOSA26_3 MIMOSA26_4 MIMOSA26_5 Monopix2_0",
+  # Gain calibration of TJ2 pixel charges
+  'pixelCalibration':       False,
+  'pixelCalibrationFile':   "/home/bgnet/vtx/tbsw_workspace_tjmp2_desy/steering-files/desy-tb-tj2/Identity_file.root",
+  # Hot pixel masking
+  'm26Masking':             [ ("MaskNormalized", False), ("MaxOccupancy", 0.00004), ("MinOccupancy", -1) ],
+  'tj2MaxNormedOccupancy':  5,
+  'tj2MinNormedOccupancy':  -1,
+  # Stop masking with pixelmask.py once the masks did not change for this number of events, 0 uses all events
+  'maskStableEvents':       0,
+  # Clusterizer
+  'tj2SparseZSCut':         0,
+  # Sigma corrections for CoG and clusterDB hits
+  'm26SigmaCorrections':    "0.698 0.31 0.315",
+  'tj2SigmaCorrections':    "0.8 0.3 0.3",
+  'm26SigmaCorrectionsDB':  "0.698 0.31 0.315",
+  'tj2SigmaCorrectionsDB':  "0.8 0.3 0.3",
+  # Track finders used for alignment
+  'alignExcludeDetector':   "",
+  'alignMaximumGap':        4,
+  'alignMinimumHits':       6,
+  'alignSingleHitSeeding':  "0",
+  'looseMaxResidual':       "0.5",
+  # Alignment errors per plane
+  'prealignerErrors':       [ ('ErrorsShiftX', '0 10 10 10 10 10 0'),
+                              ('ErrorsShiftY', '0 10 10 10 10 10 0'),
+                              ('ErrorsShiftZ', '0 0 0 0 0 0 0'),
+                              ('ErrorsAlpha',  '0 0 0 0 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0.01 0.01 0.01 0.01 0') ],
+  'alignerErrors':          [ ('ErrorsShiftX', '0 10 10 10 10 10 0'),
+                              ('ErrorsShiftY', '0 10 10 10 10 10 0'),
+                              ('ErrorsShiftZ', '0 10 10 10 10 10 0'),
+                              ('ErrorsAlpha',  '0 0 0 0.01 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0.01 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0.01 0.01 0.01 0.01 0') ],
+  # Add triplett correlator path after prealignment
+  'tripletCorrelator':      False,
+  # Convergence of repeated calibration paths with calschedule.py
+  'alignTolerance':         0.0001,
+  'clusterDBTolerance':     0.01,
+  'maxIterationFactor':     2,
+  # DUT analyzer
+  'analyzerMaxResidual':    "0.2",
+  # Command line defaults and naming of rawfiles, caltags and reconstructions
+  'gearfile':               'geoid1.xml',
+  'datapath':               '/home/bgnet/beam_data/text_files/',
+  'rawfileFormat':          "run{}.txt",
+  'caltagSeparator':        '',
+  'recoNameFromCaltag':     False,
+  'clusterDBFromPrefix':    False,
+}
+
+# Parameters which differ from the defaults for every setup
+setups = {
+  # tj2-reco.py
+  'tj2': {},
+  # tj2-reco-first-arm.py: align first arm only
+  'first-arm': {
+    'energy':               4.2,
+    'alignExcludeDetector': "4 5 6",
+    'alignMaximumGap':      1,
+    'alignMinimumHits':     3,
+    'prealignerErrors':     [ ('ErrorsShiftX', '0 10 0 10 10 10 0'),
+                              ('ErrorsShiftY', '0 10 0 10 10 10 0'),
+                              ('ErrorsShiftZ', '0 0 0 0 0 0 0'),
+                              ('ErrorsAlpha',  '0 0 0 0 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0 0.01 0.01 0.01 0') ],
+    'alignerErrors':        [ ('ErrorsShiftX', '0 10 0 10 10 10 0'),
+                              ('ErrorsShiftY', '0 10 0 10 10 10 0'),
+                              ('ErrorsShiftZ', '0 10 0 0 10 10 0'),
+                              ('ErrorsAlpha',  '0 0 0 0 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0 0.01 0.01 0.01 0') ],
+    'tripletCorrelator':    True,
+  },
+  # tj2-reco-second-arm.py: align second arm only
+  'second-arm': {
+    'energy':               4.2,
+    'alignExcludeDetector': "0 1 2",
+    'alignMaximumGap':      1,
+    'alignMinimumHits':     3,
+    'alignSingleHitSeeding': "6",
+    'prealignerErrors':     [ ('ErrorsShiftX', '0 10 0 10 0 10 0'),
+                              ('ErrorsShiftY', '0 10 0 10 0 10 0'),
+                              ('ErrorsShiftZ', '0 0 0 0 0 0 0'),
+                              ('ErrorsAlpha',  '0 0 0 0 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0 0.01 0 0.01 0') ],
+    'alignerErrors':        [ ('ErrorsShiftX', '0 10 0 10 0 10 0'),
+                              ('ErrorsShiftY', '0 10 0 10 0 10 0'),
+                              ('ErrorsShiftZ', '0 10 0 0 0 10 0'),
+                              ('ErrorsAlpha',  '0 0 0 0 0 0 0'),
+                              ('ErrorsBeta',   '0 0 0 0 0 0 0'),
+                              ('ErrorsGamma',  '0 0.01 0 0.01 0 0.01 0') ],
+    'tripletCorrelator':    True,
+  },
+  # tj2-reco_23repo.py: Adenium telescope with TJ2 gain calibration
+  '23repo': {
+    'energy':               4.2,
+    'maxRecordNrLong':      -1,
+    'verbosity':            None,
+    'sensorNames':          "Adenium_0 Adenium_1 Adenium_2 Adenium_3 Adenium_4 Adenium_5 Monopix2_0",
+    'pixelCalibration':     True,
+    'pixelCalibrationFile': 'steering-files/desy-tb-tj2/',
+    'm26Masking':           [ ("MaxNormedOccupancy", 5), ("MinNormedOccupancy", -1) ],
+    'tj2MinNormedOccupancy': 0.1,
+    'tj2SparseZSCut':       1,
+    'm26SigmaCorrections':  "0.7 0.7 0.7",
+    'tj2SigmaCorrections':  "0.7 0.7 0.7",
+    'm26SigmaCorrectionsDB': "1.0 1.0 1.0",
+    'tj2SigmaCorrectionsDB': "1.0 1.0 1.0",
+    'alignMaximumGap':      1,
+    'looseMaxResidual':     "0.9",
+    'tripletCorrelator':    True,
+    'analyzerMaxResidual':  "0.1",
+    'gearfile':             'gear_geoid12.xml',
+    'datapath':             '/home/benjamin/textdump_tbsw/',
+    'rawfileFormat':        'run{:06d}.txt',
+    'caltagSeparator':      '_',
+    'recoNameFromCaltag':   True,
+    'clusterDBFromPrefix':  True,
+  },
+}
+
+
+def get_setup(name, **overrides):
+  """
+  Returns the full parameter dictionary for the setup name. Keyword arguments
+  override single parameters.
+  """
+
+  setup = dict(defaults)
+  setup.update(setups[name])
+  setup.update(overrides)
+  return setup
+
+
+def get_globals(setup, gearfile, nevents, inputfile=None):
+  """
+  Returns the global Marlin parameters for a path
+  """
+
+  params = {'GearXMLFile': gearfile , 'MaxRecordNumber' : nevents}
+  if inputfile is None:
+    # Paths reading the rawfile
+    if setup['verbosity'] is not None:
+      params['Verbosity'] = setup['verbosity']
+  else:
+    params['LCIOInputFiles'] = inputfile
+  return params
+
+
+def get_runno(rawfile):
+  """
+  Returns the run number encoded in a rawfile name like run826.txt
+  """
+  return int(re.search(r'run(\d+)', os.path.basename(rawfile)).group(1))
+
+
+def add_rawinput(path, rawfile, setup):
+  rawinput = Processor(name="CorryInputProcessor",proctype="CorryInputProcessor")
+  rawinput.param('FileNames', rawfile)
+  rawinput.param('SensorIDs', setup['sensorIDs'])
+  rawinput.param('SensorNames', setup['sensorNames'])
+  rawinput.param('RawHitCollectionName', "rawdata")
+  rawinput.param("RunNumber", get_runno(rawfile))
+  path.add_processor(rawinput)
+
+  return path
+
+def add_unpackers(path, setup):
+  """
+  Adds unpackers to the path
+  """
+
+  m26unpacker = Processor(name="TelUnpacker", proctype="HitsFilterProcessor")
+  m26unpacker.param("InputCollectionName", "rawdata")
+  m26unpacker.param("OutputCollectionName", "zsdata_m26")
+  m26unpacker.param("FilterIDs", "0 1 2 3 4 5")
+  path.add_processor(m26unpacker)
+
+  tj2unpacker = Processor(name="TJ2Unpacker",proctype="HitsFilterProcessor")
+  tj2unpacker.param("InputCollectionName","rawdata")
+  # With gain calibration, the PixelChargeCalibrator creates zsdata_tj2
+  if setup['pixelCalibration']:
+    tj2unpacker.param("OutputCollectionName", "zsdata_tj2_raw")
+  else:
+    tj2unpacker.param("OutputCollectionName", "zsdata_tj2")
+  tj2unpacker.param("FilterIDs","22")
+  path.add_processor(tj2unpacker)
+
+  return path
+
+def get_pixelmasking(setup):
+  """
+  Returns a list of (name, sensorIDs, params) tuples describing the hot pixel
+  masking of the M26 and TJ2 sensors
+  """
+
+  m26params = list(setup['m26Masking'])
+  m26params.append( ("NoiseDBFileName", "localDB/NoiseDB-M26.root") )
+  m26params.append( ("OfflineZSThreshold", 0) )
+
+  tj2params = [ ("MaxNormedOccupancy", setup['tj2MaxNormedOccupancy']),
+                ("MinNormedOccupancy", setup['tj2MinNormedOccupancy']),
+                ("NoiseDBFileName", "localDB/NoiseDB-TJ2.root"),
+                ("OfflineZSThreshold", 0) ]
+
+  return [ ("M26HotPixelKiller", "0 1 2 3 4 5", m26params), ("TJ2HotPixelKiller", "22", tj2params) ]
+
+def add_pixelmaskers(path, setup):
+  """
+  Adds hot/dead pixel masking processors to the path
+  """
+
+  m26masking, tj2masking = get_pixelmasking(setup)
+
+  m26hotpixelkiller = Processor(name=m26masking[0],proctype="HotPixelKiller")
+  m26hotpixelkiller.param("InputCollectionName", "zsdata_m26")
+  for name, value in m26masking[2]:
+    m26hotpixelkiller.param(name, value)
+  path.add_processor(m26hotpixelkiller)
+
+
+  tj2hotpixelkiller = Processor(name=tj2masking[0], proctype="HotPixelKiller")
+  if setup['pixelCalibration']:
+    tj2hotpixelkiller.param("InputCollectionName", "zsdata_tj2_raw")
+  else:
+    tj2hotpixelkiller.param("InputCollectionName", "zsdata_tj2")
+  for name, value in tj2masking[2]:
+    tj2hotpixelkiller.param(name, value)
+  path.add_processor(tj2hotpixelkiller)
+
+  return path
+
+
+def add_pixel_calibration(path, setup):
+  """
+  Adds gain calibration of TJ2 pixel charges to the path
+  """
+
+  if not setup['pixelCalibration']:
+    return path
+
+  pixcal = Processor(name="PixelChargeCalibrator",proctype="PixelChargeCalibrator")
+  pixcal.param('SparseDataCollectionName', "zsdata_tj2_raw")
+  pixcal.param('CalibratedCollectionName', "zsdata_tj2")
+  pixcal.param('GainCalibrationDBFileName', setup['pixelCalibrationFile'])
+  pixcal.param('CalibFuncName', "calibFunc")
+  pixcal.param("CalibParaBaseName", "para")
+  path.add_processor(pixcal)
+
+  return path
+
+
+def add_clusterizers(path, setup):
+  """
+  Adds clusterizers to the path
+  """
+
+  m26clust = Processor(name="M26Clusterizer",proctype="PixelClusterizer")
+  m26clust.param("NoiseDBFileName","localDB/NoiseDB-M26.root")
+  m26clust.param("SparseDataCollectionName","zsdata_m26")
+  m26clust.param("ClusterCollectionName","zscluster_m26")
+  m26clust.param("SparseClusterCut",0)
+  m26clust.param("SparseSeedCut", 0)
+  m26clust.param("SparseZSCut", 0)
+  path.add_processor(m26clust)
+
+  tj2clust = Processor(name="TJ2Clusterizer",proctype="PixelClusterizer")
+  tj2clust.param("NoiseDBFileName","localDB/NoiseDB-TJ2.root")
+  tj2clust.param("SparseDataCollectionName","zsdata_tj2")
+  tj2clust.param("ClusterCollectionName","zscluster_tj2")
+  tj2clust.param("SparseClusterCut",0)
+  tj2clust.param("SparseSeedCut", 0)
+  tj2clust.param("SparseZSCut", setup['tj2SparseZSCut'])
+  path.add_processor(tj2clust)
+
+  return path
+
+def get_dropped_collections(setup):
+  """
+  Returns the collections not written into the intermediate LCIO files of the
+  calibration. Only clusters, hits and the TJ2 digits needed by the analyzer
+  are read again.
+  """
+
+  collections = ["rawdata", "zsdata_m26"]
+  if setup['pixelCalibration']:
+    collections.append("zsdata_tj2_raw")
+  return " ".join(collections)
+
+def add_hitmakers(path, setup):
+  """
+  Adds center of gravity hitmakers to the path
+  """
+
+  m26hitmaker = Processor(name="M26CogHitMaker",proctype="CogHitMaker")
+  m26hitmaker.param("ClusterCollection","zscluster_m26")
+  m26hitmaker.param("HitCollectionName","hit_m26")
+  m26hitmaker.param("SigmaUCorrections", setup['m26SigmaCorrections'])
+  m26hitmaker.param("SigmaVCorrections", setup['m26SigmaCorrections'])
+  path.add_processor(m26hitmaker)
+
+  tj2hitmaker = Processor(name="TJ2CogHitMaker",proctype="CogHitMaker")
+  tj2hitmaker.param("ClusterCollection","zscluster_tj2")
+  tj2hitmaker.param("HitCollectionName","hit_tj2")
+  tj2hitmaker.param("SigmaUCorrections", setup['tj2SigmaCorrections'])
+  tj2hitmaker.param("SigmaVCorrections", setup['tj2SigmaCorrections'])
+  path.add_processor(tj2hitmaker)
+
+  return path
+
+def add_cachedhitmakers(path, setup, useHitCache):
+  """
+  Adds center of gravity hitmakers to the path unless the hits are read
+  from the hit cache written by the clusterizer path
+  """
+
+  if not useHitCache:
+    path = add_hitmakers(path, setup)
+
+  return path
+
+def add_hitmakersDB(path, setup):
+  """
+  Add cluster shape hitmakers to the path (requiring clusterDBs)
+  """
+
+  m26goehitmaker = Processor(name="M26GoeHitMaker",proctype="GoeHitMaker")
+  m26goehitmaker.param("ClusterCollection","zscluster_m26")
+  m26goehitmaker.param("HitCollectionName","hit_m26")
+  m26goehitmaker.param("ClusterDBFileName","localDB/clusterDB-M26.root")
+  m26goehitmaker.param("SigmaUCorrections", setup['m26SigmaCorrectionsDB'])
+  m26goehitmaker.param("SigmaVCorrections", setup['m26SigmaCorrectionsDB'])
+  path.add_processor(m26goehitmaker)
+
+  tj2goehitmaker = Processor(name="TJ2GoeHitMaker",proctype="GoeHitMaker")
+  tj2goehitmaker.param("ClusterCollection","zscluster_tj2")
+  tj2goehitmaker.param("HitCollectionName","hit_tj2")
+  tj2goehitmaker.param("ClusterDBFileName","localDB/clusterDB-TJ2.root")
+  tj2goehitmaker.param("UseCenterOfGravityFallback","true")
+  tj2goehitmaker.param("SigmaUCorrections", setup['tj2SigmaCorrectionsDB'])
+  tj2goehitmaker.param("SigmaVCorrections", setup['tj2SigmaCorrectionsDB'])
+  path.add_processor(tj2goehitmaker)
+
+  return path
+
+def add_clustercalibrators(path):
+  """
+  Add cluster calibration processors to create clusterDB's
+  """
+
+  m26clustdb = Processor(name="M26ClusterCalibrator",proctype="GoeClusterCalibrator")
+  m26clustdb.param("ClusterDBFileName","localDB/clusterDB-M26.root")
+  m26clustdb.param("MinClusters","100")
+  m26clustdb.param("SelectPlanes","1 2 4 5")
+  path.add_processor(m26clustdb)
+
+  tj2clustdb = Processor(name="TJ2ClusterCalibrator",proctype="GoeClusterCalibrator")
+  tj2clustdb.param("ClusterDBFileName","localDB/clusterDB-TJ2.root")
+  tj2clustdb.param("MinClusters","100")
+  tj2clustdb.param("MaxEtaBins","7")
+  tj2clustdb.param("SelectPlanes","3")
+  path.add_processor(tj2clustdb)
+
+  return path
+
+def create_geometry():
+  """
+  Returns the geometry processor applying the current alignment
+  """
+
+  geo = Processor(name="Geo",proctype="Geometry")
+  geo.param("AlignmentDBFilePath", "localDB/alignmentDB.root")
+  geo.param("ApplyAlignment", "true")
+  geo.param("OverrideAlignment", "true")
+
+  return geo
+
+def create_alignment_trackfinder(setup, name, maxTrackChi2, outlierChi2Cut, maxResidual):
+  """
+  Returns a track finder using hits from all planes for alignment
+  """
+
+  trackfinder = Processor(name=name,proctype="FastTracker")
+  trackfinder.param("InputHitCollectionNameVec","hit_m26  hit_tj2")
+  trackfinder.param("ExcludeDetector", setup['alignExcludeDetector'])
+  trackfinder.param("MaxTrackChi2", maxTrackChi2)
+  trackfinder.param("MaximumGap", setup['alignMaximumGap'])
+  trackfinder.param("MinimumHits", setup['alignMinimumHits'])
+  trackfinder.param("OutlierChi2Cut", outlierChi2Cut)
+  trackfinder.param("ParticleCharge","-1")
+  trackfinder.param("ParticleMass", setup['mass'])
+  trackfinder.param("ParticleMomentum", setup['energy'])
+  trackfinder.param("SingleHitSeeding", setup['alignSingleHitSeeding'])
+  trackfinder.param("MaxResidualU", maxResidual)
+  trackfinder.param("MaxResidualV", maxResidual)
+
+  return trackfinder
+
+def create_aligner(name, errors):
+  """
+  Returns a Kalman aligner with alignment errors per plane
+  """
+
+  aligner = Processor(name=name,proctype="KalmanAligner")
+  for param, value in errors:
+    aligner.param(param, value)
+
+  return aligner
+
+def create_reco_trackfinder(setup):
+  """
+  Returns the track finder of the reconstruction using telescope hits only
+  """
+
+  trackfinder = Processor(name="TrackFinder",proctype="FastTracker")
+  trackfinder.param("InputHitCollectionNameVec","hit_m26")
+  trackfinder.param("ExcludeDetector", "3")
+  trackfinder.param("MaxTrackChi2", "100")
+  trackfinder.param("MaximumGap", "1")
+  trackfinder.param("MinimumHits","6")
+  trackfinder.param("OutlierChi2Cut", "20")
+  trackfinder.param("ParticleCharge","-1")
+  trackfinder.param("ParticleMass", setup['mass'])
+  trackfinder.param("ParticleMomentum", setup['energy'])
+  trackfinder.param("SingleHitSeeding", "0")
+  trackfinder.param("MaxResidualU","0.4")
+  trackfinder.param("MaxResidualV","0.4")
+
+  return trackfinder
+
+def create_dut_analyzer(setup, caltag):
+  """
+  Returns the TJ2 analyzer writing Hit/Track trees into Histos-TJ2-caltag.root
+  """
+
+  tj2_analyzer = Processor(name="TJ2Analyzer",proctype="PixelDUTAnalyzer")
+  tj2_analyzer.param("NoiseDBFileName","localDB/NoiseDB-TJ2.root")  # for flagging hits at hot/dead channels
+  tj2_analyzer.param("HitCollection","hit_tj2")
+  tj2_analyzer.param("DigitCollection","zsdata_tj2")
+  tj2_analyzer.param("DUTPlane","3")
+  tj2_analyzer.param("MaxResidualU", setup['analyzerMaxResidual'])
+  tj2_analyzer.param("MaxResidualV", setup['analyzerMaxResidual'])
+  tj2_analyzer.param("RootFileName","Histos-TJ2-{}.root".format(caltag))
+
+  return tj2_analyzer
+
+def create_calibration_path(Env, rawfile, gearfile, setup, useClusterDB, useHitCache=False):
+  """
+  Returns a list of tbsw path objects needed to calibrate the tracking telescope
+
+  With useHitCache, the center of gravity hits are computed once in the clusterizer
+  path and stored in tmp-hits.slcio. All iterations using CoG hits replay the cached
+  hits instead of rebuilding them from clusters in every pass.
+  """
+
+  maxRecordNrLong = setup['maxRecordNrLong']
+  maxRecordNrShort = setup['maxRecordNrShort']
+
+  # Input file for all paths using CoG hits
+  if useHitCache:
+    cogfile = "tmp-hits.slcio"
+  else:
+    cogfile = "tmp.slcio"
+
+  # Calibrations are organized in a sequence of calibration paths.
+  # The calibration paths are collected in a list for later execution
+  calpaths = []
+
+  # Create path for detector level masking of hot channels
+  mask_path = Env.create_path('mask_path')
+  mask_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrLong))
+
+  mask_path = add_rawinput(mask_path, rawfile, setup)
+
+  geo = create_geometry()
+  mask_path.add_processor(geo)
+
+  mask_path = add_unpackers(mask_path, setup)
+
+  mask_path = add_pixelmaskers(mask_path, setup)
+
+  # Add path for masking
+  calpaths.append(mask_path)
+
+  # Create path for detector level creation of clusters
+  clusterizer_path = Env.create_path('clusterizer_path')
+  clusterizer_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrLong))
+
+  clusterizer_path = add_rawinput(clusterizer_path, rawfile, setup)
+
+  clusterizer_path.add_processor(geo)
+  clusterizer_path = add_unpackers(clusterizer_path, setup)
+  clusterizer_path = add_pixel_calibration(clusterizer_path, setup)
+  clusterizer_path = add_clusterizers(clusterizer_path, setup)
+
+  lciooutput = Processor(name="LCIOOutput",proctype="LCIOOutputProcessor")
+  lciooutput.param("LCIOOutputFile","tmp.slcio")
+  lciooutput.param("LCIOWriteMode","WRITE_NEW")
+  lciooutput.param("DropCollectionNames", get_dropped_collections(setup))
+  clusterizer_path.add_processor(lciooutput)
+
+  if useHitCache:
+    # Compute CoG hits once and store them together with the clusters
+    clusterizer_path = add_hitmakers(clusterizer_path, setup)
+
+    hitoutput = Processor(name="LCIOHitOutput",proctype="LCIOOutputProcessor")
+    hitoutput.param("LCIOOutputFile","tmp-hits.slcio")
+    hitoutput.param("LCIOWriteMode","WRITE_NEW")
+    hitoutput.param("DropCollectionNames", get_dropped_collections(setup))
+    clusterizer_path.add_processor(hitoutput)
+
+  # Finished with path for clusterizers
+  calpaths.append(clusterizer_path)
+
+  # Create path for pre alignmnet and dqm based on hits
+  correlator_path = Env.create_path('correlator_path')
+  correlator_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, cogfile))
+  correlator_path.add_processor(geo)
+  correlator_path = add_cachedhitmakers(correlator_path, setup, useHitCache)
+
+  hitdqm = Processor(name="RawDQM",proctype="RawHitDQM")
+  hitdqm.param("InputHitCollectionNameVec","hit_m26  hit_tj2")
+  hitdqm.param("RootFileName","RawDQM.root")
+  correlator_path.add_processor(hitdqm)
+
+  correlator = Processor(name="TelCorrelator", proctype="Correlator")
+  correlator.param("InputHitCollectionNameVec","hit_m26  hit_tj2")
+  correlator.param("OutputRootFileName","XCorrelator.root")
+  correlator.param("ReferencePlane","0")
+  correlator.param("ParticleCharge","-1")
+  correlator.param("ParticleMass", setup['mass'])
+  correlator.param("ParticleMomentum", setup['energy'])
+  correlator_path.add_processor(correlator)
+
+  # Finished with path for hit based pre alignment
+  calpaths.append(correlator_path)
+
+  # Create path for pre alignment with loose cut track sample
+  prealigner_path = Env.create_path('prealigner_path')
+  prealigner_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, cogfile))
+  prealigner_path.add_processor(geo)
+  prealigner_path = add_cachedhitmakers(prealigner_path, setup, useHitCache)
+
+  trackfinder_loosecut = create_alignment_trackfinder(setup, "AlignTF_LC", 10000000, 100000000, setup['looseMaxResidual'])
+  prealigner_path.add_processor(trackfinder_loosecut)
+
+  prealigner = create_aligner("PreAligner", setup['prealignerErrors'])
+  prealigner_path.add_processor(prealigner)
+
+  # Finished with path for prealigner
+  calpaths.append(prealigner_path)
+
+  if setup['tripletCorrelator']:
+    # Create path for alignment with tight cut track sample
+    alignert_path = Env.create_path('alignert_path')
+    alignert_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, cogfile))
+    alignert_path.add_processor(geo)
+    alignert_path = add_cachedhitmakers(alignert_path, setup, useHitCache)
+
+    alignert_path.add_processor(trackfinder_loosecut)
+    tcorrelator = Processor(name="MyTriplettCorrelator",proctype="TriplettCorrelator")
+    tcorrelator.param("OutputRootFileName","TXCorrelator.root")
+    tcorrelator.param("TrackCollectionName","tracks")
+    tcorrelator.param("InputHitCollectionNameVec","hit_m26  hit_tj2")
+    alignert_path.add_processor(tcorrelator)
+
+    # Finished with path for triplett correlator
+    calpaths.append(alignert_path)
+
+  calpaths.append(prealigner_path)
+  calpaths.append(prealigner_path)
+
+  # Create path for alignment with tight cut track sample
+  aligner_path = Env.create_path('aligner_path')
+  aligner_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, cogfile))
+  aligner_path.add_processor(geo)
+  aligner_path = add_cachedhitmakers(aligner_path, setup, useHitCache)
+
+  trackfinder_tightcut = create_alignment_trackfinder(setup, "AlignTF_TC", 100, 20, "0.4")
+  aligner_path.add_processor(trackfinder_tightcut)
+
+  aligner = create_aligner("Aligner", setup['alignerErrors'])
+  aligner_path.add_processor(aligner)
+
+  # Finished with path for aligner
+  # Repeat this 3x
+  calpaths.append(aligner_path)
+  calpaths.append(aligner_path)
+  calpaths.append(aligner_path)
+
+  # Creeate path for some track based dqm using current calibrations
+  dqm_path = Env.create_path('dqm_path')
+  dqm_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, cogfile))
+  dqm_path.add_processor(geo)
+  dqm_path = add_cachedhitmakers(dqm_path, setup, useHitCache)
+  dqm_path.add_processor(trackfinder_tightcut)
+
+  teldqm = Processor(name="TelescopeDQM", proctype="TrackFitDQM")
+  teldqm.param("RootFileName","TelescopeDQM.root")
+  dqm_path.add_processor(teldqm)
+
+  # Finished with path for teldqm
+  calpaths.append(dqm_path)
+
+  if useClusterDB:
+    # The code below produces cluster calibration constants
+    # (clusterDB). IF you only want to use CoG hits, this part
+    # is not needed.
+
+    # Creeate path for first iteration for computing clusterDBs for all sensors
+    preclustercal_path = Env.create_path('preclustercal_path')
+    preclustercal_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrLong, cogfile))
+    preclustercal_path.add_processor(geo)
+    preclustercal_path = add_cachedhitmakers(preclustercal_path, setup, useHitCache)
+    preclustercal_path.add_processor(trackfinder_tightcut)
+    preclustercal_path = add_clustercalibrators(preclustercal_path)
+
+    # Finished with path for pre cluster calibration
+    calpaths.append(preclustercal_path)
+
+    # Create path for alignment with tight cut track sample and cluster DB
+    aligner_db_path = Env.create_path('aligner_db_path')
+    aligner_db_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, "tmp.slcio"))
+    aligner_db_path.add_processor(geo)
+    aligner_db_path = add_hitmakersDB(aligner_db_path, setup)
+    aligner_db_path.add_processor(trackfinder_tightcut)
+    aligner_db_path.add_processor(aligner)
+
+    # Finished with path for alignemnt with hits from pre clusterDB
+    # Repeat this 2x
+    for i in range(2):
+      calpaths.append(aligner_db_path)
+
+    # Creeate path for next iterations for computing clusterDBs for all sensors
+    clustercal_path = Env.create_path('clustercal_path')
+    clustercal_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrLong, "tmp.slcio"))
+    clustercal_path.add_processor(geo)
+    clustercal_path = add_hitmakersDB(clustercal_path, setup)
+    clustercal_path.add_processor(trackfinder_tightcut)
+    clustercal_path = add_clustercalibrators(clustercal_path)
+
+    # Finished with path for pre cluster calibration
+    # Repeat this 6x
+    for i in range(6):
+      calpaths.append(clustercal_path)
+
+    # Finished with path for alignemnt with hits from final clusterDB
+    # Repeat this 2x
+    for i in range(2):
+      calpaths.append(aligner_db_path)
+
+    # Creeate path for dqm using cluster calibrations
+    dqm_db_path = Env.create_path('dqm_db_path')
+    dqm_db_path.set_globals(params=get_globals(setup, gearfile, maxRecordNrShort, "tmp.slcio"))
+    dqm_db_path.add_processor(geo)
+    dqm_db_path = add_hitmakersDB(dqm_db_path, setup)
+    dqm_db_path.add_processor(trackfinder_tightcut)
+
+    teldqm_db = Processor(name="TelescopeDQM_DB", proctype="TrackFitDQM")
+    teldqm_db.param("RootFileName","TelescopeDQM_DB.root")
+    dqm_db_path.add_processor(teldqm_db)
+
+    # Finished with path for dqm with cluster calibration
+    calpaths.append(dqm_db_path)
+
+  return calpaths
+
+
+def create_reco_path(Env, rawfile, gearfile, setup, useClusterDB, caltag, clusterfile=None, hitfile=None):
+  """
+  Returns a list of tbsw path objects for reconstruciton of a test beam run
+
+  With a clusterfile, the clusters written by the clusterizer path of the
+  calibration are read instead of unpacking and clusterizing the rawfile.
+  With a hitfile, also the center of gravity hits cached by the calibration
+  are read instead of computing them again.
+  """
+
+  if hitfile is not None:
+    clusterfile = hitfile
+
+  reco_path = Env.create_path('reco_path')
+  reco_path.set_globals(params=get_globals(setup, gearfile, setup['maxRecordNrLong'], inputfile=clusterfile))
+
+  if clusterfile is None:
+    reco_path = add_rawinput(reco_path, rawfile, setup)
+
+  geo = create_geometry()
+  reco_path.add_processor(geo)
+
+  # Create path for all reconstruction up to hits
+  if clusterfile is None:
+    reco_path = add_unpackers(reco_path, setup)
+    reco_path = add_pixel_calibration(reco_path, setup)
+    reco_path = add_clusterizers(reco_path, setup)
+
+  if useClusterDB:
+    reco_path = add_hitmakersDB(reco_path, setup)
+  else:
+    reco_path = add_cachedhitmakers(reco_path, setup, hitfile is not None)
+
+  reco_path.add_processor(create_reco_trackfinder(setup))
+  reco_path.add_processor(create_dut_analyzer(setup, caltag))
+
+  return [ reco_path ]
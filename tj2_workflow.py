@@ -0,0 +1,474 @@
+"""
+Calibration and reconstruction workflow shared by the tj2 reco scripts.
+
+The scripts tj2-reco.py, tj2-reco_23repo.py, tj2-reco-first-arm.py,
+tj2-reco-second-arm.py and tj2-reco-both-arms.py only select a setup from
+tj2_paths.setups and call main().
+"""
+
+from tbsw.tbsw import Calibration, Reconstruction
+import tj2_paths
+import rawhits
+import calcache
+import pixelmask
+import calschedule
+import profiling
+import runsummary
+import parquetexport
+from runlist import parse_runlist
+import os
+import sys
+import hashlib
+import shutil
+import argparse
+import subprocess
+import functools
+import multiprocessing
+import traceback
+
+# Parameters of the selected setup and command line arguments, set in main()
+setup = None
+overrides = {}
+arms = None
+args = None
+useClusterDB = True
+
+
+def split_mask_path(rawfile, calpaths, setup):
+  """
+  Removes the mask path from the calibration paths when the NoiseDB files are built
+  from the hit store. Returns the remaining paths and a string describing the masking
+  for the calibration cache keys.
+  """
+
+  if not args.fastmask:
+    return calpaths, ''
+  masking = calcache.serialize_paths(rawfile, calpaths[:1])
+  if setup['maskStableEvents'] > 0:
+    masking += ' maskStableEvents={:d}'.format(setup['maskStableEvents'])
+  return calpaths[1:], masking
+
+def build_noisedbs(rawfile, steerfiles, gearfile, tmpdir, setup):
+  """
+  Writes the NoiseDB files into the localDB folder of tmpdir using the hit store
+  of the rawfile in --hitstoredir. The hit store is created when missing or older
+  than the rawfile.
+  """
+
+  hitstore = rawhits.get_hitstore_name(rawfile, hitstoredir=args.hitstoredir)
+  if not os.path.isdir(hitstore) or os.path.getmtime(hitstore) < os.path.getmtime(rawfile):
+    rawhits.convert(rawfile, hitstore, sensorIDs=setup['sensorIDs'], sensorNames=setup['sensorNames'])
+
+  masking = tj2_paths.get_pixelmasking(setup)
+  pixelmask.build_noisedbs(hitstore, os.path.join(steerfiles, gearfile), masking, maxevents=setup['maxRecordNrLong'], dbdir=tmpdir, stableEvents=setup['maskStableEvents'])
+
+def get_noisedbs(setup):
+  """
+  Returns the names of the NoiseDB files inside the localDB folder
+  """
+  return [ os.path.basename(dict(params)['NoiseDBFileName']) for name, sensorIDs, params in tj2_paths.get_pixelmasking(setup) ]
+
+def get_hitconfig(setup):
+  """
+  Returns a string describing the center of gravity hit makers
+  """
+  return 'm26SigmaCorrections={} tj2SigmaCorrections={}'.format(setup['m26SigmaCorrections'], setup['tj2SigmaCorrections'])
+
+def get_clusterconfig(Env, rawfile, gearfile, setup):
+  """
+  Returns a string describing the raw input, unpackers, gain calibration and
+  clusterizers, including the contents of their input files like the gain DB
+  """
+  path = Env.create_path('clusterconfig')
+  path = tj2_paths.add_rawinput(path, rawfile, setup)
+  path = tj2_paths.add_unpackers(path, setup)
+  path = tj2_paths.add_pixel_calibration(path, setup)
+  path = tj2_paths.add_clusterizers(path, setup)
+  digest = hashlib.sha1(calcache.serialize_paths(rawfile, [path]).encode('utf8'))
+  return calcache.hash_inputs(rawfile, gearfile, [path], digest).hexdigest()
+
+def copy_noisedbs(sourcedir, tmpdir, setup):
+  """
+  Copies the NoiseDB files from the localDB folder of sourcedir into the localDB folder of tmpdir
+  """
+
+  os.makedirs(os.path.join(tmpdir, 'localDB'), exist_ok=True)
+  for filename in get_noisedbs(setup):
+    shutil.copy2(os.path.join(sourcedir, 'localDB', filename), os.path.join(tmpdir, 'localDB', filename))
+
+def calibrate(params, setup, checkpoint=False, noisedbdir=None):
+  """
+  Calibrates a run. With --fastmask, the NoiseDB files are built from the hit store,
+  or copied from the localDB folder of noisedbdir if given. Returns the list of
+  checkpoint keys of the calibration steps, which is empty without checkpoints.
+  """
+
+  rawfile, steerfiles, gearfile, caltag = params
+
+  # Calibrate of the run using beam data. Creates a folder cal-files/caltag
+  # containing all calibration data.
+  calname = os.path.splitext(os.path.basename(rawfile))[0] + '-' + caltag + '-cal'
+  CalObj = Calibration(steerfiles=steerfiles, name=calname)
+  tmpdir = os.path.join(os.getcwd(), 'tmp-runs', calname)
+  if args.profile:
+    CalObj = profiling.ProfiledEnv(CalObj, tmpdir)
+  # Create list of calibration paths
+  calpaths = tj2_paths.create_calibration_path(CalObj, rawfile, gearfile, setup, useClusterDB, args.hitcache)
+  calpaths, extra = split_mask_path(rawfile, calpaths, setup)
+  if args.adaptive:
+    extra += ' adaptive alignTolerance={} clusterDBTolerance={} maxIterationFactor={}'.format(setup['alignTolerance'], setup['clusterDBTolerance'], setup['maxIterationFactor'])
+
+  if args.calcache:
+    # Reuse an earlier calibration of the same rawfile with identical paths
+    key = calcache.get_key(rawfile, os.path.join(steerfiles, gearfile), calpaths, extra=extra)
+    if calcache.restore(key, caltag):
+      print("Restored calibration from cache ", key)
+      return []
+
+  if args.fastmask and noisedbdir is not None:
+    copy_noisedbs(noisedbdir, tmpdir, setup)
+  elif args.fastmask:
+    build_noisedbs(rawfile, steerfiles, gearfile, tmpdir, setup)
+
+  # Run the calibration steps
+  keys = []
+  if checkpoint or args.checkpoint:
+    keys = calcache.calibrate_steps(CalObj, calpaths, rawfile, os.path.join(steerfiles, gearfile), caltag, tmpdir, extra=extra)
+  elif args.adaptive:
+    calschedule.calibrate_adaptive(CalObj, calpaths, rawfile, caltag, tmpdir, setup)
+  elif args.calcache:
+    # Only calibrations without failed Marlin jobs may enter the cache
+    for path in calpaths:
+      calcache.run_step(CalObj, path, rawfile, caltag, tmpdir)
+  else:
+    CalObj.calibrate(paths=calpaths,ifile=rawfile,caltag=caltag)
+
+  if args.profile:
+    CalObj.write_report(os.path.join('profiles', calname))
+
+  if args.calcache:
+    calcache.store(key, caltag)
+
+  if args.clustercache:
+    # Keep the clusters for the reconstruction
+    clusterconfig = get_clusterconfig(CalObj, rawfile, os.path.join(steerfiles, gearfile), setup)
+    calcache.store_clusters(tmpdir, rawfile, caltag, get_noisedbs(setup), clusterconfig=clusterconfig, hitconfig=get_hitconfig(setup))
+
+  return keys
+
+
+def get_reco_name(rawfile, caltag, setup):
+  """
+  Returns the name of the reconstruction of a rawfile
+  """
+
+  if setup['recoNameFromCaltag']:
+    return os.path.splitext(os.path.basename(rawfile))[0] + '-' + caltag + '-reco'
+  return os.path.splitext(os.path.basename(rawfile))[0] + '-' + args.prefix + '-reco'
+
+def get_histofile(rawfile, caltag, setup):
+  """
+  Returns the name of the root file with Hit/Track trees of the reconstruction
+  """
+  return os.path.join('root-files', 'Histos-TJ2-{}-{}.root'.format(caltag, get_reco_name(rawfile, caltag, setup)))
+
+def reconstruct(params, setup):
+
+  rawfile, steerfiles, gearfile, caltag = params
+
+  # Reconsruct the rawfile using caltag. Resulting root files are
+  # written to folder root-files/
+  RecObj = Reconstruction(steerfiles=steerfiles, name=get_reco_name(rawfile, caltag, setup) )
+  if args.profile:
+    RecObj = profiling.ProfiledEnv(RecObj, os.path.join(os.getcwd(), 'tmp-runs', get_reco_name(rawfile, caltag, setup)))
+
+  # Reuse the clusters and CoG hits of the calibration if the masks did not change
+  clusterfile = None
+  hitfile = None
+  if args.clustercache:
+    clusterconfig = get_clusterconfig(RecObj, rawfile, os.path.join(steerfiles, gearfile), setup)
+    clusterfile = calcache.find_clusters(rawfile, caltag, get_noisedbs(setup), clusterconfig)
+    if not useClusterDB:
+      hitfile = calcache.find_hits(rawfile, caltag, get_noisedbs(setup), clusterconfig, get_hitconfig(setup))
+    if hitfile is not None:
+      print("Reconstruct from stored hits ", hitfile)
+    elif clusterfile is not None:
+      print("Reconstruct from stored clusters ", clusterfile)
+
+  # Create reconstuction path
+  recopath = tj2_paths.create_reco_path(RecObj, rawfile, gearfile, setup, useClusterDB, caltag, clusterfile=clusterfile, hitfile=hitfile)
+
+  # Run the reconstuction
+  RecObj.reconstruct(paths=recopath,ifile=rawfile,caltag=caltag)
+
+  # Store the run summary used by the plotter
+  runsummary.write(get_histofile(rawfile, caltag, setup))
+
+  if args.profile:
+    RecObj.write_report(os.path.join('profiles', get_reco_name(rawfile, caltag, setup)))
+
+def reconstruct_sharded(params, setup, nshards):
+  """
+  Reconstructs the rawfile in nshards event ranges processed in parallel. The
+  Hit/Track trees of all shards are merged in event order into the same root
+  file as written by reconstruct().
+  """
+
+  rawfile, steerfiles, gearfile, caltag = params
+
+  # Split the rawfile into consecutive event ranges
+  sharddir = os.path.join(os.getcwd(), 'tmp-runs', get_reco_name(rawfile, caltag, setup) + '-shards')
+  shardfiles = rawhits.split_textfile(rawfile, nshards, sharddir, maxevents=setup['maxRecordNrLong'])
+
+  # Every shard has its own reconstruction folder in tmp-runs
+  pool = multiprocessing.Pool(processes=min(len(shardfiles), args.ncores))
+  pool.map(functools.partial(reconstruct, setup=setup), [ ( shardfile, steerfiles, gearfile, caltag ) for shardfile in shardfiles ])
+  pool.close()
+  pool.join()
+
+  # Merge the shards in event order
+  histofiles = [ get_histofile(shardfile, caltag, setup) for shardfile in shardfiles ]
+  subprocess.check_call(['hadd', '-f', get_histofile(rawfile, caltag, setup)] + histofiles)
+  runsummary.write(get_histofile(rawfile, caltag, setup))
+
+  for histofile in histofiles:
+    os.remove(histofile)
+  shutil.rmtree(sharddir)
+
+def process_run(params):
+  """
+  Calibrates and reconstructs a single run. A new calibration is made
+  when caltag is empty, otherwise the existing caltag is used.
+  """
+
+  rawfile, steerfiles, gearfile, caltag = params
+
+  if caltag == '':
+    # Tag for calibration data
+    caltag = os.path.splitext(os.path.basename(rawfile))[0] + setup['caltagSeparator'] + args.prefix
+    print("Make new alignment ", caltag)
+    calibrate( ( rawfile, steerfiles, gearfile, caltag ), setup )
+  else:
+    print("Use old alignment ", caltag)
+
+  # Reconstruct the rawfile
+  if args.nshards > 1:
+    reconstruct_sharded( ( rawfile, steerfiles, gearfile, caltag ), setup, args.nshards )
+  else:
+    reconstruct( ( rawfile, steerfiles, gearfile, caltag ), setup )
+
+  if args.parquet:
+    parquetexport.export(get_histofile(rawfile, caltag, setup), outdir='parquet-files')
+
+def process_arm(params):
+  """
+  Multiprocessing work for calibration and reconstruction of one telescope arm.
+  Steps shared with other arms are restored from checkpoints and the NoiseDB
+  files are copied from the upstream folder. Returns the checkpoint keys of
+  the calibration steps.
+  """
+
+  rawfile, steerfiles, gearfile, caltag, name, uptmpdir = params
+
+  armsetup = tj2_paths.get_setup(name, recoNameFromCaltag=True, **overrides)
+  keys = calibrate( ( rawfile, steerfiles, gearfile, caltag ), armsetup, checkpoint=True, noisedbdir=uptmpdir )
+  reconstruct( ( rawfile, steerfiles, gearfile, caltag ), armsetup )
+
+  if args.parquet:
+    parquetexport.export(get_histofile(rawfile, caltag, armsetup), outdir='parquet-files')
+
+  return keys
+
+def process_arms(params, arms):
+  """
+  Calibrates and reconstructs a run for several telescope arms. Unpacking, masking
+  and clusterization are identical for all arms. They run only once and all arms
+  continue from the same clusters. The arm specific alignment and reconstruction
+  run in parallel.
+
+  The arms need checkpoints of all calibration steps, they are removed after all
+  arms finished unless --checkpoint is given. After a failure they are kept, so
+  that a rerun resumes with the failed step.
+  """
+
+  rawfile, steerfiles, gearfile, caltag = params
+
+  basetag = os.path.splitext(os.path.basename(rawfile))[0] + setup['caltagSeparator'] + args.prefix
+
+  # Find the calibration steps shared by all arms
+  upname = os.path.splitext(os.path.basename(rawfile))[0] + '-' + basetag + '-upstream-cal'
+  UpObj = Calibration(steerfiles=steerfiles, name=upname)
+  armpaths = [ tj2_paths.create_calibration_path(UpObj, rawfile, gearfile, tj2_paths.get_setup(name, **overrides), useClusterDB, args.hitcache) for name in arms ]
+  masking = split_mask_path(rawfile, armpaths[0], setup)[1]
+  armpaths = [ split_mask_path(rawfile, paths, setup)[0] for paths in armpaths ]
+  configs = [ [ calcache.serialize_paths(rawfile, [path]) for path in paths ] for paths in armpaths ]
+
+  nshared = 0
+  while all( nshared < len(config) and config[nshared] == configs[0][nshared] for config in configs ):
+    nshared += 1
+
+  # Run the shared steps once, their checkpoints are restored by all arms
+  print("Run {:d} calibration steps shared by arms {}".format(nshared, ', '.join(arms)))
+  tmpdir = os.path.join(os.getcwd(), 'tmp-runs', upname)
+  if args.fastmask:
+    build_noisedbs(rawfile, steerfiles, gearfile, tmpdir, setup)
+  keys = calcache.calibrate_steps(UpObj, armpaths[0][:nshared], rawfile, os.path.join(steerfiles, gearfile), basetag + '-upstream', tmpdir, extra=masking, export=False)
+
+  armparams = [ ( rawfile, steerfiles, gearfile, basetag + '_' + name, name, tmpdir ) for name in arms ]
+  if multiprocessing.current_process().daemon:
+    # Already running inside a batch worker
+    armkeys = [ process_arm(armparam) for armparam in armparams ]
+  else:
+    pool = multiprocessing.Pool(processes=len(armparams))
+    armkeys = pool.map(process_arm, armparams)
+    pool.close()
+    pool.join()
+
+  # The checkpoints hold copies of the LCIO intermediates, keep them only on request
+  if not args.checkpoint:
+    calcache.remove_checkpoints(keys + sum(armkeys, []))
+
+def process_batch(params):
+  """
+  Multiprocessing work for batch mode. Failures are reported and do not
+  stop the processing of other runs.
+  """
+
+  try:
+    if arms:
+      process_arms(params, arms)
+    else:
+      process_run(params)
+    return True
+  except Exception:
+    traceback.print_exc()
+    return False
+
+def str2bool(v):
+  if v.lower() in ('yes', 'true', 'on','t', 'y', '1'):
+    return True
+  elif v.lower() in ('no', 'false', 'off','f', 'n', '0'):
+    return False
+  else:
+    raise argparse.ArgumentTypeError('Boolean value expected.')
+
+def create_parser(name):
+  """
+  Returns the command line parser with defaults of the setup name
+  """
+
+  defaults = tj2_paths.get_setup(name)
+
+  parser = argparse.ArgumentParser(description="Perform calibration and reconstruction of a test beam run")
+  parser.add_argument('--steerfiles', dest='steerfiles', default='steering-files/desy-tb/', type=str, help='Path to steerfiles')
+  parser.add_argument('--gearfile', dest='gearfile', default=defaults['gearfile'], type=str, help='Name of gearfile inside steerfiles folder')
+  parser.add_argument('--datapath', dest='datapath', default=defaults['datapath'], type=str, help='Path to data')
+  parser.add_argument('--runno', dest='runno', type=int, help='Run number')
+  parser.add_argument('--runlist', dest='runlist', default='', type=str, help='List of runs to process in batch mode, e.g. 826,830-835')
+  parser.add_argument('--ncores', dest='ncores', default=multiprocessing.cpu_count(), type=int, help='Number of runs processed in parallel in batch mode')
+  parser.add_argument('--nshards', dest='nshards', default=1, type=int, help='Number of event ranges reconstructed in parallel for a single run')
+  parser.add_argument('--caltag', dest='caltag', default='', type=str, help='Name of calibration tag to use')
+  parser.add_argument('--prefix', dest='prefix', default='', type=str, help='Name of calibration tag prefix to use')
+  parser.add_argument('--minocc', dest='minocc', default=None, type=float, help='Minimum normed occupancy for TJ2 masking (default: {})'.format(defaults['tj2MinNormedOccupancy']))
+  parser.add_argument('--table', dest='table', default='/home/bgnet/vtx/tbsw_workspace_tjmp2_desy/export_with_text_del_text.csv', type=str, help='Name of look up table to link run to geo-id')
+  parser.add_argument('--pixel_cal', action='store_true', help='if added, the value is set to true and the analysis will run with in pixel calibration. The default is false.')
+  parser.add_argument('--no_pixel_cal', dest='pixel_cal', action='store_false')
+  parser.add_argument('--pixel_cal_file', dest='pixel_cal_file', default=None, type=str, help='Path to pixel calibration file (default: {})'.format(defaults['pixelCalibrationFile']))
+  parser.set_defaults(pixel_cal=False)
+  parser.add_argument('--clip', action='store_true', help='if added, the value is set to true and the analysis will run with in pixel calibration. The default is false.')
+  parser.add_argument('--CoG', action='store_true', help='if added, the value is set to true and the analysis will run with Center of Gravity. The default is false.')
+  parser.add_argument('--no_CoG', dest='CoG', action='store_false')
+  parser.add_argument('--cliptag', dest='cliptag', default='', type=str, help='gives threshold for clipping')
+  parser.add_argument('--calcache', action='store_true', help='if added, calibrations are stored in and restored from the calibration cache in cal-cache/. The default is false.')
+  parser.add_argument('--checkpoint', action='store_true', help='if added, every calibration step is checkpointed in cal-checkpoints/ and a rerun resumes with the first step without checkpoint. The default is false.')
+  parser.add_argument('--fastmask', action='store_true', help='if added, the NoiseDB files are computed from the binary hit store of the rawfile instead of running the mask path. The default is false.')
+  parser.add_argument('--hitstoredir', dest='hitstoredir', default=rawhits.hitstoredir, type=str, help='Folder for the binary hit stores used by --fastmask (default: {})'.format(rawhits.hitstoredir))
+  parser.add_argument('--maskstable', dest='maskstable', default=None, type=int, help='With --fastmask, stop masking once the masks did not change for this number of events (default: {})'.format(defaults['maskStableEvents']))
+  parser.add_argument('--clustercache', action='store_true', help='if added, the clusters of the calibration are kept in cluster-store/ and the reconstruction reads them instead of clusterizing the rawfile again while the NoiseDB files are unchanged. The default is false.')
+  parser.add_argument('--adaptive', action='store_true', help='if added, repeated aligner and clustercal paths are iterated until the alignmentDB and clusterDB files converge instead of a fixed number of times. The default is false.')
+  parser.add_argument('--profile', action='store_true', help='if added, wall time, cpu time, peak memory and the Marlin timing of every processor are written per path into profiles/. The default is false.')
+  parser.add_argument('--parquet', action='store_true', help='if added, the Hit and Track trees of the reconstruction are also exported as Parquet files into parquet-files/. Needs pyarrow. The default is false.')
+  parser.add_argument('--hitcache', action='store_true', help='if added, CoG hits are computed once during clusterization and replayed in all calibration iterations. The default is false.')
+  parser.set_defaults(clip=False)
+  parser.set_defaults(CoG=False)
+
+  return parser
+
+def main(name, telescopeArms=None):
+  """
+  Calibrates and reconstructs the runs given on the command line using the setup name.
+  With a list of setup names in telescopeArms, every run is calibrated and reconstructed
+  once per arm and the steps shared by all arms are processed only once.
+  """
+
+  global setup, overrides, arms, args, useClusterDB
+
+  parser = create_parser(name)
+  args = parser.parse_args()
+  arms = telescopeArms
+
+  if arms and args.caltag != '':
+    parser.error('--caltag cannot be used when calibrating several arms')
+  if arms and args.nshards > 1:
+    parser.error('--nshards cannot be used when calibrating several arms')
+  if args.parquet and parquetexport.pyarrow is None:
+    parser.error('--parquet needs the pyarrow package')
+  if args.adaptive and (args.checkpoint or arms):
+    parser.error('--adaptive cannot be combined with checkpointed calibration steps')
+
+  # Command line overrides for setup parameters
+  overrides = {}
+  if args.minocc is not None:
+    overrides['tj2MinNormedOccupancy'] = args.minocc
+  if args.pixel_cal_file is not None:
+    overrides['pixelCalibrationFile'] = args.pixel_cal_file
+  if args.maskstable is not None:
+    if not args.fastmask:
+      parser.error('--maskstable requires --fastmask')
+    overrides['maskStableEvents'] = args.maskstable
+  setup = tj2_paths.get_setup(name, **overrides)
+
+  if setup['clusterDBFromPrefix']:
+    useClusterDB = 'clustdb' in args.prefix
+  else:
+    useClusterDB = not args.CoG
+
+  if useClusterDB:
+    print('clustdb')
+  else:
+    print('CoG')
+
+  if args.runlist == '' and args.runno is None:
+    parser.error('--runno or --runlist is required')
+
+  if args.runlist == '':
+    runs = [ args.runno ]
+  else:
+    runs = parse_runlist(args.runlist)
+
+  # Make sure that we have absolute paths
+  params_list = [ ( os.path.abspath(args.datapath + setup['rawfileFormat'].format(run)), args.steerfiles, args.gearfile, args.caltag ) for run in runs ]
+
+  if len(params_list) > 1 and args.nshards > 1:
+    parser.error('--nshards can only be used for a single run')
+
+  if len(params_list) == 1 and arms:
+    process_arms( params_list[0], arms )
+  elif len(params_list) == 1:
+    process_run( params_list[0] )
+  else:
+    # Every run has its own tmp-runs folder and caltag, so runs
+    # can be processed in parallel
+    count = min(args.ncores, len(params_list))
+    pool = multiprocessing.Pool(processes=count)
+    results = pool.map(process_batch, params_list)
+    pool.close()
+    pool.join()
+
+    for run, ok in zip(runs, results):
+      if not ok:
+        print("Processing of run {} failed".format(run))
+
+    # Let shell scripts and cron jobs detect failed runs
+    if not all(results):
+      sys.exit(1)